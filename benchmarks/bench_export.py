@@ -0,0 +1,196 @@
+# Measures the export hot path against the fake Slack server from the test
+# suite: messages per second, wall time and peak RSS of fetch_from_slack on
+# its own, of a full main() export to a file, and of the same export
+# replayed from a recorded fixture (with --latency per request) so that it
+# does not depend on the HTTP stack.
+#
+#   python benchmarks/bench_export.py --messages 50000 --latency 0.005
+#
+# Every case runs in a fresh interpreter so its peak RSS is its own.
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import slack2csv.slack2csv  # noqa: E402
+from slack2csv.slack2csv import fetch_from_slack, main  # noqa: E402
+from slack2csv.tests.fake_slack import FakeSlack  # noqa: E402
+
+CASES = ['fetch', 'main', 'replay']
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        peak /= 1024.0
+    return peak / 1024.0
+
+
+def fake_slack(args):
+    start = int(time.time()) - args.messages - 60
+    return FakeSlack(channels={"C1": args.messages}, users=args.users,
+                     page_size=args.page_size, latency=args.latency,
+                     rate_limit_every=args.rate_limit_every,
+                     retry_after=0, start=start)
+
+
+def bench_fetch(args, slack, workdir):
+    count = 0
+    for msg in fetch_from_slack('benchmark', 'C1', slack.start, quiet=True):
+        count += 1
+    return count
+
+
+def bench_main(args, slack, workdir, extra_argv=()):
+    filename = os.path.join(workdir, 'out.' + args.format)
+    past_days = args.messages // 86400 + 2
+    sys.argv = ['slack2csv', '--token', 'benchmark', '--channel', 'channel-c1',
+                '--filename', filename, '--format', args.format,
+                '--past_days', str(past_days),
+                '--cache_dir', os.path.join(workdir, 'cache')]
+    sys.argv.extend(extra_argv)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        main()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return args.messages
+
+
+def record_fixture(args, slack, workdir):
+    # an untimed export against the server, recorded for bench_replay
+    fixture = os.path.join(workdir, 'fixture.jsonl.gz')
+    latency = slack.latency
+    slack.latency = 0.0
+    bench_main(args, slack, workdir, ['--record_fixture', fixture])
+    slack.latency = latency
+    return fixture
+
+
+def bench_replay(args, slack, workdir, fixture):
+    return bench_main(args, slack, workdir,
+                      ['--replay_fixture', fixture,
+                       '--replay_latency', str(args.latency)])
+
+
+def run_case(args):
+    # runs one case in this process and returns its measurements
+    slack2csv.slack2csv.PACE_REQUESTS = False
+    workdir = tempfile.mkdtemp(prefix='slack2csv-bench-')
+    try:
+        with fake_slack(args) as slack:
+            slack2csv.slack2csv.SLACK_API_URL = slack.url
+            if args.run == 'replay':
+                fixture = record_fixture(args, slack, workdir)
+                requests = slack.requests
+                started = time.time()
+                count = bench_replay(args, slack, workdir, fixture)
+                wall = time.time() - started
+                rate_limited = 0
+            else:
+                started = time.time()
+                count = {'fetch': bench_fetch, 'main': bench_main}[args.run](
+                    args, slack, workdir)
+                wall = time.time() - started
+                requests = slack.requests
+                rate_limited = slack.rate_limited
+    finally:
+        shutil.rmtree(workdir)
+    return {
+        'case': args.run,
+        'messages': count,
+        'wall_seconds': round(wall, 3),
+        'messages_per_second': round(count / wall, 1) if wall else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'requests': requests,
+        'rate_limited': rate_limited,
+    }
+
+
+def spawn_case(case, argv):
+    out = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                   '--run', case] + argv)
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='slack2csv benchmarks')
+    parser.add_argument('--messages', help='messages in the channel',
+                        type=int, default=20000)
+    parser.add_argument('--page_size', help='messages per history page',
+                        type=int, default=200)
+    parser.add_argument('--latency', help='seconds the server waits before '
+                                          'each response',
+                        type=float, default=0.0)
+    parser.add_argument('--rate_limit_every', help='answer every nth request '
+                                                   'with a 429, 0 to never',
+                        type=int, default=0)
+    parser.add_argument('--users', help='users in the workspace',
+                        type=int, default=100)
+    parser.add_argument('--format', help='output format of the main case',
+                        default='csv')
+    parser.add_argument('--cases', help='comma separated cases to run',
+                        default=','.join(CASES))
+    parser.add_argument('--repeat', help='runs per case, the fastest counts',
+                        type=int, default=3)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--run', help=argparse.SUPPRESS, choices=CASES)
+    return parser.parse_args(argv)
+
+
+def bench(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parse_args(argv)
+    if args.run:
+        print(json.dumps(run_case(args)))
+        return
+
+    # pass everything but the case selection on to the child processes
+    child_argv = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in ('--cases', '--repeat', '--json'):
+            skip = True
+        elif not arg.startswith(('--cases=', '--repeat=', '--json=')):
+            child_argv.append(arg)
+
+    results = []
+    print("{0:<8} {1:>10} {2:>10} {3:>12} {4:>10} {5:>9}".format(
+        'case', 'messages', 'wall s', 'msgs/s', 'peak MB', '429s'))
+    for case in args.cases.split(','):
+        runs = [spawn_case(case.strip(), child_argv)
+                for _ in range(max(args.repeat, 1))]
+        best = min(runs, key=lambda r: r['wall_seconds'])
+        results.append(best)
+        print("{case:<8} {messages:>10} {wall_seconds:>10.3f} "
+              "{messages_per_second:>12.1f} {peak:>10} {rate_limited:>9}"
+              .format(peak='n/a' if best['peak_rss_mb'] is None else
+                      '{0:.1f}'.format(best['peak_rss_mb']), **best))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,101 @@
+# Measures turning messages into CSV rows, the per-message cost of every
+# export, against the original writer: building the row on its own and a
+# full CsvWriter.write into an in-memory file, for flat messages and for
+# messages with a nested field.
+#
+#   python benchmarks/bench_rows.py --rows 200000
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from slack2csv.writers import CsvWriter, compile_columns  # noqa: E402
+
+
+def flat_message(i):
+    return {
+        "type": "message",
+        "user": "U{0:07d}".format(i % 100),
+        "text": "message {0}".format(i),
+        "ts": "{0}.000100".format(1500000000 + i),
+        "team": "T0000001",
+        "client_msg_id": "c{0}".format(i),
+        "thread_ts": "{0}.000100".format(1500000000 + i - i % 10),
+        "reply_count": i % 3,
+    }
+
+
+def nested_message(i):
+    msg = flat_message(i)
+    msg["reactions"] = [{"name": "tada", "count": 2}]
+    return msg
+
+
+def baseline_rows(messages, header):
+    for msg in messages:
+        [msg.get(k) for k in header]
+
+
+def project_rows(messages, header):
+    project = compile_columns(header)
+    for msg in messages:
+        project(msg)
+
+
+def baseline_write(messages, header):
+    # the writer slack2csv started with
+    csvwriter = csv.writer(io.StringIO() if str is not bytes else
+                           io.BytesIO())
+    for msg in messages:
+        csvwriter.writerow([msg.get(k) for k in header])
+
+
+def csv_writer_write(messages, header):
+    writer = CsvWriter(io.StringIO() if str is not bytes else io.BytesIO(),
+                       header)
+    for msg in messages:
+        writer.write(msg)
+
+
+CASES = [
+    ('rows: baseline', baseline_rows),
+    ('rows: compile_columns', project_rows),
+    ('write: baseline', baseline_write),
+    ('write: CsvWriter', csv_writer_write),
+]
+
+
+def best_of(func, messages, header, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.time()
+        func(messages, header)
+        timings.append(time.time() - started)
+    return min(timings)
+
+
+def bench(argv=None):
+    parser = argparse.ArgumentParser(description='slack2csv row building '
+                                                 'benchmark')
+    parser.add_argument('--rows', help='messages per run', type=int,
+                        default=200000)
+    parser.add_argument('--repeat', help='runs per case, the fastest counts',
+                        type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print("{0:<8} {1:<24} {2:>10}".format('messages', 'case', 'seconds'))
+    for kind, make in [('flat', flat_message), ('nested', nested_message)]:
+        messages = [make(i) for i in range(args.rows)]
+        header = sorted(messages[0])
+        for name, func in CASES:
+            seconds = best_of(func, messages, header, max(args.repeat, 1))
+            print("{0:<8} {1:<24} {2:>10.3f}".format(kind, name, seconds))
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,49 @@
+# Measures how long the command line takes to start: --help, a usage error
+# and importing the export code, each in a fresh interpreter.
+#
+#   python benchmarks/bench_startup.py --repeat 20
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ('python', [sys.executable, '-c', 'pass']),
+    ('--help', [sys.executable, '-m', 'slack2csv', '--help']),
+    ('usage error', [sys.executable, '-m', 'slack2csv', '--token', 'x']),
+    ('import export code', [sys.executable, '-c',
+                            'import slack2csv.slack2csv']),
+]
+
+
+def time_command(command, repeat):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    timings = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(repeat):
+            started = time.time()
+            subprocess.call(command, stdout=devnull, stderr=devnull, env=env)
+            timings.append(time.time() - started)
+    timings.sort()
+    return timings[0], timings[len(timings) // 2]
+
+
+def bench(argv=None):
+    parser = argparse.ArgumentParser(description='slack2csv startup '
+                                                 'benchmark')
+    parser.add_argument('--repeat', help='runs per case', type=int,
+                        default=10)
+    args = parser.parse_args(argv)
+
+    print("{0:<20} {1:>10} {2:>10}".format('case', 'min ms', 'median ms'))
+    for name, command in CASES:
+        fastest, median = time_command(command, max(args.repeat, 1))
+        print("{0:<20} {1:>10.1f} {2:>10.1f}".format(name, fastest * 1000,
+                                                     median * 1000))
+
+
+if __name__ == "__main__":
+    bench()
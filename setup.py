@@ -133,6 +133,11 @@ setup(
     extras_require={  # Optional
         'dev': ['pytest', 'mock'],
         'test': ['coverage'],
+        'async': ['aiohttp'],
+        'parquet': ['pyarrow'],
+        'zstd': ['zstandard'],
+        'fast': ['orjson'],
+        'yaml': ['PyYAML'],
     },
 
     # If there are data files included in your packages that need to be
@@ -160,7 +165,8 @@ setup(
     # executes the function `main` from this package when invoked:
     entry_points={  # Optional
         'console_scripts': [
-            'slack2csv=slack2csv:main',
+            'slack2csv=slack2csv.cli:main',
+            'slack2csv-manifest=slack2csv.manifest:main',
         ],
     },
 )
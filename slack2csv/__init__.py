@@ -0,0 +1,4 @@
+def main(argv=None):
+    # the console script; imports stay lazy so that --help is quick
+    from .cli import main
+    return main(argv)
@@ -0,0 +1,253 @@
+# asyncio versions of paged_query and fetch_from_slack, so that many
+# conversations can be in flight on a single thread. Needs Python 3.6+ and
+# aiohttp (pip install slack2csv[async]); the blocking API in slack2csv.py
+# stays the default.
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .defaults import (DEFAULT_POOL_SIZE, DEFAULT_REQUEST_TIMEOUT,
+                       DEFAULT_RETRIES, DEFAULT_WORKERS, RETRY_BACKOFF_FACTOR,
+                       RETRY_STATUS_CODES)
+from .ratelimit import RateLimiter
+from .slack2csv import (CHANNEL_PLACEHOLDER, QUERY_API_TIMEOUT,
+                        MessageWriter, PageDone, SlackClient, api_method,
+                        conversation_name, history_url)
+from .fastjson import loads, project
+from .filters import compile_filter
+from .writers import open_csv_writer
+
+
+class AsyncSlackClient(object):
+    # The asyncio counterpart of SlackClient: one pooled aiohttp session,
+    # paced by a (possibly shared) RateLimiter, measured by an optional
+    # Metrics and recording pages in an optional PageArchive.
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_REQUEST_TIMEOUT, retries=DEFAULT_RETRIES,
+                 limiter=None, pace=True, metrics=None, json_loads=None,
+                 archive=None):
+        if aiohttp is None:
+            raise ImportError("the asyncio engine needs aiohttp, "
+                              "install it with: pip install slack2csv[async]")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        if limiter is None:
+            limiter = RateLimiter() if pace else RateLimiter(rates={})
+        self.limiter = limiter
+        self.metrics = metrics
+        self.json_loads = json_loads or loads
+        self.archive = archive
+        self.requests = 0
+        self.fetch_seconds = 0.0
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _session(self):
+        # aiohttp sessions have to be created inside the running loop
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def get_json(self, url):
+        method = api_method(url)
+        metrics = self.metrics
+        loop = asyncio.get_event_loop()
+        rate_limited = 0
+        failures = 0
+        while True:
+            delay = self.limiter.reserve(method)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                if metrics is not None:
+                    metrics.observe('sleep_seconds', delay, reason='pace')
+            start = loop.time()
+            body = None
+            try:
+                async with self._session().get(url) as r:
+                    status = r.status
+                    retry_after = r.headers.get('Retry-After')
+                    if status != 429 and status not in RETRY_STATUS_CODES:
+                        body = await r.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status = None
+                if failures >= self.retries:
+                    raise
+            finally:
+                elapsed = loop.time() - start
+                self.fetch_seconds += elapsed
+                self.requests += 1
+                if metrics is not None:
+                    metrics.observe('request_seconds', elapsed, method=method)
+
+            if body is not None:
+                if metrics is None:
+                    resp = self.json_loads(body)
+                else:
+                    metrics.add('bytes_received', len(body), method=method)
+                    start = loop.time()
+                    resp = self.json_loads(body)
+                    metrics.observe('decode_seconds', loop.time() - start,
+                                    method=method)
+                if self.archive is not None:
+                    self.archive.record(url, resp)
+                return resp
+
+            if status == 429:
+                rate_limited += 1
+                if rate_limited > self.retries:
+                    raise ValueError("Rate limited by Slack: ", method)
+                delay = self.limiter.penalize(
+                    method, float(retry_after or QUERY_API_TIMEOUT))
+                if metrics is not None:
+                    metrics.add('rate_limited', method=method)
+                    metrics.observe('sleep_seconds', delay,
+                                    reason='retry_after')
+                await asyncio.sleep(delay)
+            else:
+                failures += 1
+                if failures > self.retries:
+                    raise ValueError("Slack returned HTTP error: ", status)
+                await asyncio.sleep(RETRY_BACKOFF_FACTOR * 2 ** failures)
+
+    summary = SlackClient.summary
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+async def paged_query(url, client, cursor=None):
+    query_url = url
+    if cursor:
+        query_url = url + "&cursor=" + cursor
+    next_cursor = True
+    while next_cursor:
+        resp = await client.get_json(query_url)
+
+        yield resp
+
+        next_cursor = resp.get("response_metadata", {}).get("next_cursor", None)
+        if next_cursor:
+            query_url = url + "&cursor=" + next_cursor
+
+
+async def fetch_from_slack(token, channel, oldest, client, cursor=None,
+                           page_markers=False, fields=None):
+    url = history_url(token, channel, oldest)
+    # records are paged oldest to newest, however the message order
+    # within a single response is newest to oldest
+    async for message_resp in paged_query(url, client, cursor):
+        if not message_resp['ok']:
+            raise ValueError("Error fetching channel history from Slack: ",
+                             message_resp["error"])
+        messages = message_resp['messages']
+        for message in reversed(messages):
+            yield message if fields is None else project(message, fields)
+        if page_markers:
+            yield PageDone(message_resp.get("response_metadata", {}).get(
+                "next_cursor", None), messages[0]['ts'] if messages else None)
+
+
+async def export_conversation(token, conversation_id, oldest, writer,
+                              text='', client=None, channel_column=False,
+                              state=None, keep=None, fields=None,
+                              enrich=None):
+    if keep is None:
+        keep = compile_filter(text)
+    checkpoint = None
+    cursor = None
+    if state is not None:
+        checkpoint = state.checkpoint(conversation_id, oldest)
+        oldest = checkpoint.oldest
+        cursor = checkpoint.cursor
+    sink = MessageWriter(writer, conversation_id, keep, channel_column,
+                         enrich, checkpoint, getattr(client, 'metrics', None))
+
+    async for msg in fetch_from_slack(token, conversation_id, oldest, client,
+                                      cursor, checkpoint is not None, fields):
+        sink.write(msg)
+    return sink.close()
+
+
+async def export_conversations(token, conversations, oldest, filename,
+                               text='', client=None,
+                               workers=DEFAULT_WORKERS, state=None,
+                               open_writer=open_csv_writer, keep=None,
+                               fields=None, enrich=None):
+    # Same output as slack2csv.export_conversations, with at most `workers`
+    # conversations being fetched at once on the running event loop.
+    per_channel = CHANNEL_PLACEHOLDER in filename
+    append = state is not None
+    merged = None
+    if not per_channel:
+        merged = open_writer(filename, append)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def export(channel):
+        name = conversation_name(channel) or channel["id"]
+        writer = merged
+        async with semaphore:
+            try:
+                if per_channel:
+                    writer = open_writer(
+                        filename.replace(CHANNEL_PLACEHOLDER, name), append)
+                try:
+                    count = await export_conversation(
+                        token, channel["id"], oldest, writer, text, client,
+                        channel_column=not per_channel, state=state,
+                        keep=keep, fields=fields, enrich=enrich)
+                finally:
+                    if per_channel:
+                        writer.close()
+            except Exception as e:
+                print("Error exporting", name, ":", e)
+                return False
+        print("Exported {0} messages from {1}".format(count, name))
+        return True
+
+    try:
+        results = await asyncio.gather(*[export(c) for c in conversations])
+    finally:
+        if merged is not None:
+            merged.close()
+    return all(results)
+
+
+def run(coro):
+    # asyncio.run only exists from Python 3.7 on
+    if hasattr(asyncio, 'run'):
+        return asyncio.run(coro)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def export_conversations_sync(token, conversations, oldest, filename, text='',
+                              workers=DEFAULT_WORKERS, state=None,
+                              open_writer=open_csv_writer, keep=None,
+                              fields=None, enrich=None, **client_options):
+    # Blocking wrapper used by main(); returns (ok, client summary).
+    async def export():
+        async with AsyncSlackClient(**client_options) as client:
+            ok = await export_conversations(token, conversations, oldest,
+                                            filename, text, client, workers,
+                                            state, open_writer, keep,
+                                            fields, enrich)
+            return ok, client.summary()
+
+    return run(export())
@@ -0,0 +1,177 @@
+from bisect import bisect_left, bisect_right
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .compression import open_input_file, open_output_file
+from .slack2csv import api_method
+
+try:
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from urlparse import parse_qs, urlparse
+
+
+# what is kept of each API method: the list in its responses, and the field
+# that identifies an item across pages and runs
+ARCHIVED_METHODS = {
+    'conversations.history': ('messages', 'ts'),
+    'conversations.replies': ('messages', 'ts'),
+    'conversations.list': ('channels', 'id'),
+    'users.list': ('members', 'id'),
+}
+
+# messages per conversations.history page when replaying
+REPLAY_PAGE_SIZE = 1000
+
+
+def request_params(url):
+    return dict((k, v[0]) for k, v in parse_qs(urlparse(url).query).items())
+
+
+def collection(method, params):
+    # the archive collection a request belongs to, e.g.
+    # "conversations.history-C123"; tokens and cursors are left out
+    if method in ('conversations.history', 'conversations.replies'):
+        key = method + '-' + params.get('channel', '')
+        if method == 'conversations.replies':
+            key += '-' + params.get('ts', '')
+        return key
+    if method == 'conversations.list':
+        return method + '-' + params.get('types', '')
+    return method
+
+
+class PageArchive(object):
+    # Raw Slack API pages kept on disk, so exports can be run again without
+    # the network. Every page is stored once as gzipped JSON named by the
+    # sha256 of its content; an append only index per collection lists the
+    # pages fetched for it, oldest run first. Safe to share between threads.
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.merged = {}
+
+    def page_path(self, digest):
+        return os.path.join(self.path, 'pages', digest[:2],
+                            digest + '.json.gz')
+
+    def index_path(self, name):
+        return os.path.join(self.path, 'index', name + '.jsonl')
+
+    def record(self, url, resp):
+        method = api_method(url)
+        if method not in ARCHIVED_METHODS or not resp.get('ok'):
+            return
+        name = collection(method, request_params(url))
+        data = json.dumps(resp, sort_keys=True)
+        digest = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        page_path = self.page_path(digest)
+        with self.lock:
+            if not os.path.exists(page_path):
+                write_page(page_path, data)
+            index_path = self.index_path(name)
+            if not os.path.isdir(os.path.dirname(index_path)):
+                os.makedirs(os.path.dirname(index_path))
+            with open(index_path, 'a') as f:
+                f.write(json.dumps({'page': digest, 'fetched': time.time()}))
+                f.write('\n')
+
+    def pages(self, name):
+        try:
+            index = open(self.index_path(name))
+        except (IOError, OSError):
+            return
+        with index:
+            for line in index:
+                if line.strip():
+                    with open_input_file(
+                            self.page_path(json.loads(line)['page'])) as f:
+                        yield json.load(f)
+
+    def items(self, method, params):
+        # every item ever archived for a request, the newest copy of each,
+        # sorted by the field identifying them, and the sorted values of
+        # that field; (None, None) when nothing was archived
+        name = collection(method, params)
+        with self.lock:
+            if name not in self.merged:
+                field, key = ARCHIVED_METHODS[method]
+                items = None
+                for page in self.pages(name):
+                    if items is None:
+                        items = {}
+                    for item in page.get(field, ()):
+                        items[item[key]] = item
+                keys = None
+                if items is not None:
+                    if key == 'ts':
+                        keys = sorted(items, key=float)
+                        items = [items[k] for k in keys]
+                        keys = [float(k) for k in keys]
+                    else:
+                        keys = sorted(items)
+                        items = [items[k] for k in keys]
+                self.merged[name] = (items, keys)
+            return self.merged[name]
+
+
+def write_page(path, data):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_path = path + '.tmp'
+    with open_output_file(tmp_path, 'w', 'gzip') as f:
+        f.write(data)
+    os.rename(tmp_path, path)
+
+
+class ArchiveClient(object):
+    # Stands in for SlackClient and answers every request from a
+    # PageArchive, so the usual fetch, filter and writer pipeline replays an
+    # archive with no network and no rate limit sleeps.
+
+    def __init__(self, archive, page_size=REPLAY_PAGE_SIZE, metrics=None):
+        self.archive = archive
+        self.page_size = page_size
+        self.metrics = metrics
+        self.json_loads = None
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def get_json(self, url):
+        method = api_method(url)
+        params = request_params(url)
+        with self.lock:
+            self.requests += 1
+        if method not in ARCHIVED_METHODS:
+            return {"ok": False, "error": "not_archived: " + method}
+        items, keys = self.archive.items(method, params)
+        if items is None:
+            return {"ok": False, "error": "not_in_archive: " +
+                    collection(method, params)}
+        field = ARCHIVED_METHODS[method][0]
+        start, end = 0, len(items)
+        if method == 'conversations.history':
+            start = bisect_left(keys, float(params.get('oldest', 0)))
+            if 'latest' in params:
+                end = bisect_right(keys, float(params['latest']))
+        offset = start + int(params.get('cursor', 0) or 0)
+        page = items[offset:min(offset + self.page_size, end)]
+        next_cursor = ""
+        if offset + self.page_size < end:
+            next_cursor = str(offset + self.page_size - start)
+        if method == 'conversations.history':
+            # like Slack: pages run oldest to newest, each newest first
+            page = page[::-1]
+        return {"ok": True, field: page,
+                "response_metadata": {"next_cursor": next_cursor}}
+
+    def summary(self):
+        return "Replayed {0} requests from {1}".format(self.requests,
+                                                      self.archive.path)
+
+    def close(self):
+        pass
@@ -0,0 +1,229 @@
+# The console script. Parsing and validating arguments only needs the
+# standard library, so --help and usage errors return at once; the HTTP
+# client and the export code are imported once there is work to do.
+import argparse
+import re
+
+from .compression import DEFAULT_BUFFER_SIZE
+from .defaults import (DEFAULT_CACHE_DIR, DEFAULT_FILE_WORKERS,
+                       DEFAULT_POOL_SIZE, DEFAULT_PREFETCH_PAGES,
+                       DEFAULT_REQUEST_TIMEOUT, DEFAULT_RETRIES,
+                       DEFAULT_TTL_HOURS, DEFAULT_WORKERS, FORMATS,
+                       PARTITIONS)
+from .filters import (DEFAULT_EXCLUDED_SUBTYPES, MATCH_MODES,
+                      compile_text_match)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='slack2csv',
+                                     description='slack2csv')
+    parser.add_argument('--text', help='text to search for', default='')
+    parser.add_argument(
+        '--threads', help='also export thread replies, right after the '
+                          'message that started the thread',
+        action='store_true')
+    filterOptions = parser.add_argument_group('filter options')
+    filterOptions.add_argument(
+        '--match', help='how --text has to match the message text',
+        choices=MATCH_MODES, default='prefix')
+    filterOptions.add_argument(
+        '--users', help='comma separated user ids or names to keep messages '
+                        'of')
+    filterOptions.add_argument(
+        '--exclude_subtypes', help='comma separated message subtypes to drop',
+        default=','.join(DEFAULT_EXCLUDED_SUBTYPES))
+    filterOptions.add_argument(
+        '--search', help='let Slack search.messages find candidates for '
+                         '--text instead of fetching the whole history',
+        action='store_true')
+    parser.add_argument(
+        '--past_days', help='days to go back', default='1')
+    requiredNamed = parser.add_argument_group('required named arguments')
+    requiredNamed.add_argument(
+        '--token', help='Slack API token', required=True)
+    requiredNamed.add_argument(
+        '--filename', help='output filename', required=True)
+    mutuallyExclusiveRequired = parser.add_mutually_exclusive_group(required=True)
+    mutuallyExclusiveRequired.add_argument(
+        '--channel', help='Slack channel id or name')
+    mutuallyExclusiveRequired.add_argument(
+        '--user', help='Slack user id or name')
+    mutuallyExclusiveRequired.add_argument(
+        '--channels',
+        help='comma separated Slack channel ids or name globs to export '
+             'concurrently; put {channel} in the filename for one CSV each')
+    multiOptions = parser.add_argument_group('multi channel options')
+    multiOptions.add_argument(
+        '--types', help='conversation types to match --channels against',
+        default='public_channel,private_channel')
+    multiOptions.add_argument(
+        '--exclude_archived', help='leave archived channels out',
+        action='store_true')
+    multiOptions.add_argument(
+        '--min_members', help='leave out channels with fewer members',
+        type=int)
+    multiOptions.add_argument(
+        '--skip_unchanged',
+        help='leave out channels not updated since the last export of them '
+             '(with --state_file) or within --past_days, going by the '
+             'updated time conversations.list reports',
+        action='store_true')
+    multiOptions.add_argument(
+        '--workers', help='channels to export at the same time', type=int,
+        default=DEFAULT_WORKERS)
+    multiOptions.add_argument(
+        '--engine', help='run the channel exports on a thread pool or on '
+                         'one asyncio event loop (needs aiohttp)',
+        choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument(
+        '--state_file',
+        help='export incrementally: append only messages newer than the '
+             'last run to the CSV and keep progress in this file, so an '
+             'interrupted export resumes where it stopped')
+    parser.add_argument(
+        '--format', help='write CSV, JSON Lines, Parquet (needs pyarrow) or '
+                         'upsert into a SQLite database',
+        choices=FORMATS, default='csv')
+    parser.add_argument(
+        '--partition', help='write a file per day or month of messages, '
+                            'named by the filename with {period} replaced, '
+                            'e.g. {channel}/{period}/part.csv',
+        choices=PARTITIONS)
+    parser.add_argument(
+        '--compress', help='compress the output, auto picks gzip for .gz '
+                           'and zstd for .zst filenames',
+        choices=['auto', 'none', 'gzip', 'zstd'], default='auto')
+    parser.add_argument(
+        '--buffer_size', help='bytes to buffer before writing to the output '
+                              'file', type=int, default=DEFAULT_BUFFER_SIZE)
+    parser.add_argument(
+        '--columns',
+        help='comma separated columns to write, dotted paths reach into '
+             'nested fields, e.g. ts,user,text,reactions.0.name')
+    parser.add_argument(
+        '--schema', help='take the columns from the first message, or from '
+                         'all messages by spooling them to disk first',
+        choices=['first', 'union'], default='first')
+    parser.add_argument(
+        '--enrich', help='add user_name and text_resolved columns, with '
+                         'names in place of user ids and <@U...>/<#C...> '
+                         'references',
+        action='store_true')
+    parser.add_argument(
+        '--slices', help='split the time window into this many slices and '
+                         'fetch them concurrently', type=int, default=1)
+    parser.add_argument(
+        '--prefetch', help='pages to fetch ahead while earlier ones are '
+                           'written, 0 to fetch and write in turn',
+        type=int, default=DEFAULT_PREFETCH_PAGES)
+    cacheOptions = parser.add_argument_group('directory cache options')
+    cacheOptions.add_argument(
+        '--cache_dir', help='where to cache user and channel name lookups, '
+                            'empty to disable', default=DEFAULT_CACHE_DIR)
+    cacheOptions.add_argument(
+        '--directory_ttl', help='hours before cached lookups expire',
+        type=float, default=DEFAULT_TTL_HOURS)
+    cacheOptions.add_argument(
+        '--refresh_directory', help='ignore cached lookups and refetch them',
+        action='store_true')
+    httpOptions = parser.add_argument_group('http connection options')
+    httpOptions.add_argument(
+        '--pool_size', help='max pooled connections to Slack', type=int,
+        default=DEFAULT_POOL_SIZE)
+    httpOptions.add_argument(
+        '--request_timeout', help='seconds to wait for a Slack response',
+        type=float, default=DEFAULT_REQUEST_TIMEOUT)
+    httpOptions.add_argument(
+        '--retries', help='retries for failed connections and 5xx errors',
+        type=int, default=DEFAULT_RETRIES)
+    fileOptions = parser.add_argument_group('file options')
+    fileOptions.add_argument(
+        '--files_dir',
+        help='download the files shared in exported messages into this '
+             'directory, once per file across channels and runs, and write '
+             'their local paths in a file_paths column')
+    fileOptions.add_argument(
+        '--file_workers', help='files to download at the same time',
+        type=int, default=DEFAULT_FILE_WORKERS)
+    metricsOptions = parser.add_argument_group('metrics options')
+    metricsOptions.add_argument(
+        '--metrics_json', help='write request, decode, sleep and write '
+                               'timings and row counts to this JSON file')
+    metricsOptions.add_argument(
+        '--metrics_prom', help='write the same metrics in Prometheus text '
+                               'format, e.g. for the node_exporter textfile '
+                               'collector')
+    archiveOptions = parser.add_argument_group('archive options')
+    archiveOptions.add_argument(
+        '--archive_dir', help='also keep the raw Slack API pages in this '
+                              'directory, for --from_archive')
+    archiveOptions.add_argument(
+        '--from_archive', help='export from the pages kept in this archive '
+                               'directory instead of calling Slack')
+    fixtureOptions = parser.add_argument_group('fixture options')
+    fixtureOptions.add_argument(
+        '--record_fixture',
+        help='also write every Slack API response, tokens scrubbed, to this '
+             'gzipped fixture file for --replay_fixture')
+    fixtureOptions.add_argument(
+        '--replay_fixture',
+        help='answer every Slack API request from this fixture file instead '
+             'of calling Slack')
+    fixtureOptions.add_argument(
+        '--replay_latency', help='seconds each replayed request takes',
+        type=float, default=0.0)
+    return parser
+
+
+def parse_args(argv=None):
+    # validation errors exit here, before anything heavy is imported
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.engine == 'asyncio' and not args.channels:
+        parser.error("--engine asyncio needs --channels")
+    if args.slices > 1 and args.state_file:
+        parser.error("--slices can not be combined with --state_file")
+    if args.slices > 1 and args.engine == 'asyncio':
+        parser.error("--slices needs --engine threads")
+    if args.search and (args.state_file or args.slices > 1 or
+                        args.engine == 'asyncio'):
+        parser.error("--search can not be combined with --state_file, "
+                     "--slices or --engine asyncio")
+    if args.threads and args.engine == 'asyncio':
+        parser.error("--threads needs --engine threads")
+    if args.files_dir and args.engine == 'asyncio':
+        parser.error("--files_dir needs --engine threads")
+    try:
+        compile_text_match(args.text, args.match)
+    except re.error as e:
+        parser.error("--text is not a valid --match regex: " + str(e))
+    if args.search and args.match == 'regex':
+        parser.error("--search can not look for a --match regex")
+    if args.schema == 'union' and args.state_file:
+        parser.error("--schema union can not be combined with --state_file")
+    if args.format == 'parquet' and args.state_file:
+        parser.error("--format parquet can not be combined with --state_file")
+    if bool(args.partition) != ('{period}' in args.filename):
+        parser.error("--partition needs {period} in the filename, and "
+                     "{period} needs --partition")
+    if args.partition and args.format == 'sqlite':
+        parser.error("--partition can not be combined with --format sqlite")
+    if ((args.record_fixture or args.replay_fixture) and
+            args.engine == 'asyncio'):
+        parser.error("--record_fixture and --replay_fixture need "
+                     "--engine threads")
+    if args.replay_fixture and (args.record_fixture or args.from_archive):
+        parser.error("--replay_fixture can not be combined with "
+                     "--record_fixture or --from_archive")
+    if args.from_archive and (args.archive_dir or args.state_file or
+                              args.search or args.engine == 'asyncio'):
+        parser.error("--from_archive can not be combined with --archive_dir, "
+                     "--state_file, --search or --engine asyncio")
+
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from .slack2csv import run
+    return run(args)
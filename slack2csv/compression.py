@@ -0,0 +1,92 @@
+import gzip
+import io
+import sys
+
+# the Python 2 csv and json modules read and write byte strings
+PY2 = sys.version_info[0] == 2
+
+
+# bytes buffered before each write to the output file
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+EXTENSIONS = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+
+
+def infer_compression(filename, compress=None):
+    # None or 'auto' picks the compression from the file extension
+    if compress in (None, 'auto'):
+        for extension, compression in EXTENSIONS.items():
+            if filename.endswith(extension):
+                return compression
+        return 'none'
+    return compress
+
+
+def zstandard_module():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression needs zstandard, install it "
+                          "with: pip install slack2csv[zstd]")
+    return zstandard
+
+
+class _GzipFile(gzip.GzipFile):
+    # A GzipFile that also closes the file object it writes into
+
+    def close(self):
+        raw = self.fileobj
+        try:
+            gzip.GzipFile.close(self)
+        finally:
+            if raw is not None:
+                raw.close()
+
+
+def open_output_file(filename, mode='w', compress=None,
+                     buffer_size=DEFAULT_BUFFER_SIZE):
+    # Opens filename for writing text in mode 'w' or 'a', compressing on the
+    # fly. Compressed data reaches the disk in buffer_size chunks, and
+    # flush() pushes everything written so far through the compressor.
+    # On Python 2 the file takes byte strings, like the builtin open().
+    compress = infer_compression(filename, compress)
+    if compress == 'none':
+        if PY2:
+            return open(filename, mode + 'b', buffer_size)
+        return io.open(filename, mode, buffering=buffer_size,
+                       encoding='utf-8')
+    raw = io.open(filename, mode + 'b', buffering=buffer_size)
+    if compress == 'gzip':
+        stream = _GzipFile(fileobj=raw, mode=mode + 'b')
+    elif compress == 'zstd':
+        stream = zstandard_module().ZstdCompressor().stream_writer(raw)
+    else:
+        raw.close()
+        raise ValueError("Unknown compression: ", compress)
+    if PY2:
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+
+def open_input_file(filename, compress=None):
+    # the text of filename, or its bytes on Python 2
+    compress = infer_compression(filename, compress)
+    if compress == 'none':
+        if PY2:
+            return open(filename, 'rb')
+        return io.open(filename, encoding='utf-8')
+    if compress == 'gzip':
+        stream = gzip.open(filename, 'rb')
+    elif compress == 'zstd':
+        # appended files hold one zstd frame per run
+        stream = io.BufferedReader(
+            zstandard_module().ZstdDecompressor().stream_reader(
+                io.open(filename, 'rb'), read_across_frames=True))
+    else:
+        raise ValueError("Unknown compression: ", compress)
+    if PY2:
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8')
@@ -0,0 +1,34 @@
+# Defaults shared by the command line and the modules implementing them,
+# kept free of imports so that cli.py can build its parser without loading
+# the HTTP client.
+import os
+
+# connection pool and retry defaults for the shared Slack client
+DEFAULT_POOL_SIZE = 10
+DEFAULT_REQUEST_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+# concurrent channel exports when --channels is used
+DEFAULT_WORKERS = 4
+
+# concurrent file downloads with --files_dir
+DEFAULT_FILE_WORKERS = 4
+
+# history pages fetched ahead of the writer
+DEFAULT_PREFETCH_PAGES = 4
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME',
+                   os.path.join(os.path.expanduser('~'), '.cache')),
+    'slack2csv')
+
+# hours before a cached directory is fetched from Slack again
+DEFAULT_TTL_HOURS = 24
+
+# output formats, see writers.WRITERS
+FORMATS = ('csv', 'jsonl', 'parquet', 'sqlite')
+
+# periods output can be partitioned by, see writers.PERIOD_FORMATS
+PARTITIONS = ('day', 'month')
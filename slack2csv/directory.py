@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .defaults import DEFAULT_CACHE_DIR, DEFAULT_TTL_HOURS
+from .slack2csv import conversation_name, list_conversations, list_users
+
+
+class Directory(object):
+    # name -> id indexes of the workspace's users and conversations. Each
+    # index is built from a single walk of users.list / conversations.list,
+    # kept in memory for the rest of the run and cached as JSON under
+    # cache_dir. Pass cache_dir=None to keep it in memory only. A name
+    # missing from an index read from the cache, e.g. a channel created or
+    # renamed since, rebuilds that index once before it is reported missing.
+
+    def __init__(self, token, client=None, cache_dir=DEFAULT_CACHE_DIR,
+                 ttl=DEFAULT_TTL_HOURS * 60 * 60, refresh=False):
+        self.token = token
+        self.client = client
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.refresh = refresh
+        self.indexes = {}
+        # the indexes read from the cache and not rebuilt since
+        self.cached = set()
+        self.lock = threading.Lock()
+        # one lock per index, so different indexes can be built at once
+        self.locks = {}
+
+    def user_id(self, name):
+        return self.lookup('users', name)
+
+    def channel_id(self, name, types=None):
+        return self.lookup('conversations:' + (types or ''), name)
+
+    def users(self):
+        return self.index('users')
+
+    def conversations(self, types=None):
+        return self.index('conversations:' + (types or ''))
+
+    def user_names(self):
+        # id -> name, the other way around
+        return inverse(self.users())
+
+    def channel_names(self, types=None):
+        return inverse(self.conversations(types))
+
+    def prefetch(self, users=False, channel_types=None):
+        # start building indexes on background threads, to be waited for
+        # by the first lookup; a failed build is retried (and raises) there
+        kinds = []
+        if users:
+            kinds.append('users')
+        if channel_types is not None:
+            kinds.append('conversations:' + channel_types)
+        for kind in kinds:
+            thread = threading.Thread(target=self.try_index, args=(kind,))
+            thread.daemon = True
+            thread.start()
+
+    def try_index(self, kind):
+        try:
+            self.index(kind)
+        except Exception:
+            pass
+
+    def lookup(self, kind, name):
+        index = self.index(kind)
+        if name not in index and kind in self.cached:
+            index = self.index(kind, rebuild=True)
+        return index.get(name, "")
+
+    def index(self, kind, rebuild=False):
+        with self.lock:
+            lock = self.locks.setdefault(kind, threading.Lock())
+        with lock:
+            if rebuild and kind in self.cached:
+                # not done yet by another thread missing the same index
+                del self.indexes[kind]
+            if kind not in self.indexes:
+                index = None
+                if not self.refresh and not rebuild:
+                    index = self.load(kind)
+                if index is None:
+                    index = self.build(kind)
+                    self.save(kind, index)
+                    self.cached.discard(kind)
+                else:
+                    self.cached.add(kind)
+                self.indexes[kind] = index
+            return self.indexes[kind]
+
+    def build(self, kind):
+        index = {}
+        if kind == 'users':
+            for user in list_users(self.token, self.client):
+                index.setdefault(user["name"], user["id"])
+        else:
+            types = kind.split(':', 1)[1] or None
+            for channel in list_conversations(self.token, types, self.client):
+                name = conversation_name(channel)
+                if name is not None:
+                    index.setdefault(name, channel["id"])
+        return index
+
+    def path(self, kind):
+        # one file per workspace token, without storing the token itself
+        workspace = hashlib.sha256(self.token.encode('utf-8')).hexdigest()
+        kind = kind.replace(':', '-').replace(',', '+')
+        return os.path.join(self.cache_dir,
+                            'directory-{0}-{1}.json'.format(workspace[:16],
+                                                            kind))
+
+    def load(self, kind):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.path(kind)) as f:
+                cached = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if time.time() - cached.get('created', 0) > self.ttl:
+            return None
+        return cached.get('index')
+
+    def save(self, kind, index):
+        if not self.cache_dir:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self.path(kind)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'created': time.time(), 'index': index}, f)
+        os.rename(tmp_path, path)
+
+
+def inverse(index):
+    return dict((id, name) for name, id in index.items())
@@ -0,0 +1,28 @@
+import re
+
+
+# <@U123ABC>, <#C123ABC> and <#C123ABC|general> references in message text;
+# older private channels have G ids
+REFERENCE = re.compile(r'<([@#])([UWCG][A-Z0-9]+)(?:\|([^>]*))?>')
+
+
+def compile_enrich(user_names, channel_names):
+    # Builds the stage adding names to messages, once per run and shared by
+    # every conversation: user_name for the user id and text_resolved, the
+    # text with user and channel references replaced by @name and #name.
+    # Unknown ids are kept as they are.
+    def resolve(match):
+        kind, id, label = match.groups()
+        if kind == '@':
+            return '@' + user_names.get(id, label or id)
+        return '#' + channel_names.get(id, label or id)
+
+    def enrich(msg):
+        msg['user_name'] = user_names.get(msg.get('user'))
+        text = msg.get('text')
+        if text and '<' in text:
+            text = REFERENCE.sub(resolve, text)
+        msg['text_resolved'] = text
+        return msg
+
+    return enrich
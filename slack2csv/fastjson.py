@@ -0,0 +1,29 @@
+# Optional fast JSON decoding. orjson parses Slack's pages several times
+# faster than the standard library and straight from bytes (pip install
+# slack2csv[fast]); without it everything falls back to json.
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def fast_loads():
+    # the fastest bytes -> object decoder available, None for the stdlib
+    if orjson is not None:
+        return orjson.loads
+    return None
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def project(msg, fields):
+    # a copy of msg with only the top level keys in fields
+    return dict((k, v) for k, v in msg.items() if k in fields)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+from multiprocessing.pool import ThreadPool
+import os
+import re
+import threading
+
+import requests
+
+from .defaults import (DEFAULT_FILE_WORKERS, DEFAULT_REQUEST_TIMEOUT,
+                       DEFAULT_RETRIES)
+from .pipeline import ordered_imap
+from .sessions import pooled_session
+
+# bytes read from a download at a time
+FILE_CHUNK_SIZE = 64 * 1024
+
+# messages that may wait for their files to be downloaded
+DEFAULT_FILE_WINDOW = 1000
+
+# the column downloaded files are written to, ';' separated
+FILE_PATHS_COLUMN = 'file_paths'
+
+UNSAFE_NAME = re.compile(r'[^\w.-]+')
+
+
+class FileStore(object):
+    # Files shared in Slack messages, downloaded into one directory. Every
+    # file is streamed to disk and stored once under the sha256 of its
+    # content, <sha256[:2]>/<sha256>/<name>; index.jsonl maps file ids to
+    # those paths, so a file seen again, in any channel or run, is not
+    # downloaded again. Downloads run on one pool of `workers` threads,
+    # however many conversations are exported at once. Safe to share
+    # between threads.
+
+    def __init__(self, path, token, workers=DEFAULT_FILE_WORKERS,
+                 timeout=DEFAULT_REQUEST_TIMEOUT, retries=DEFAULT_RETRIES,
+                 metrics=None):
+        self.path = path
+        self.token = token
+        self.workers = workers
+        self.timeout = timeout
+        self.metrics = metrics
+        self.by_id = {}
+        self.by_hash = {}
+        self.lock = threading.Lock()
+        # one lock per file id, so a file shared twice downloads once
+        self.locks = {}
+        self.session = pooled_session(workers, retries)
+        self.pool = None
+        self.load()
+
+    def index_path(self):
+        return os.path.join(self.path, 'index.jsonl')
+
+    def load(self):
+        try:
+            index = open(self.index_path())
+        except (IOError, OSError):
+            return
+        with index:
+            for line in index:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.by_id[entry['id']] = entry['path']
+                    self.by_hash[entry['sha256']] = entry['path']
+
+    def local_path(self, file):
+        # the path of a file shared in a message, downloading it first if
+        # it is not in the store yet; None for files with nothing to fetch,
+        # e.g. external or deleted ones, and for files that fail to download
+        url = file.get('url_private_download') or file.get('url_private')
+        if not url or 'id' not in file:
+            return None
+        with self.lock:
+            lock = self.locks.setdefault(file['id'], threading.Lock())
+        with lock:
+            path = self.by_id.get(file['id'])
+            if path is not None and os.path.exists(
+                    os.path.join(self.path, path)):
+                self.count('files_cached')
+            else:
+                try:
+                    path = self.download(file, url)
+                except (ValueError, requests.RequestException) as e:
+                    # e.g. a file deleted or unshared since, the export
+                    # goes on without it
+                    print("Could not download file", file['id'], e)
+                    self.count('files_failed')
+                    return None
+            return os.path.join(self.path, path)
+
+    def download(self, file, url):
+        tmp_dir = os.path.join(self.path, 'tmp')
+        with self.lock:
+            # downloads of other files may get here at the same time
+            if not os.path.isdir(tmp_dir):
+                os.makedirs(tmp_dir)
+        tmp_path = os.path.join(tmp_dir, file['id'] + '.part')
+        digest = hashlib.sha256()
+        size = 0
+        r = self.session.get(url, stream=True, timeout=self.timeout,
+                             headers={'Authorization': 'Bearer ' + self.token})
+        try:
+            if r.status_code != 200:
+                raise ValueError("Error downloading file from Slack: ",
+                                 file['id'], r.status_code)
+            # without the files:read scope Slack answers with its login page
+            if (r.headers.get('Content-Type', '').startswith('text/html') and
+                    not file.get('mimetype', '').startswith('text/html')):
+                raise ValueError("Slack sent a web page instead of file, "
+                                 "does the token have files:read? ",
+                                 file['id'])
+            with open(tmp_path, 'wb') as f:
+                for chunk in r.iter_content(FILE_CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            r.close()
+        sha256 = digest.hexdigest()
+        self.count('files_downloaded')
+        self.count('file_bytes', size)
+
+        with self.lock:
+            path = self.by_hash.get(sha256)
+            if path is not None and os.path.exists(
+                    os.path.join(self.path, path)):
+                # the same content shared under another file id
+                os.remove(tmp_path)
+                self.count('files_deduplicated')
+            else:
+                name = UNSAFE_NAME.sub('_', file.get('name') or file['id'])
+                path = os.path.join(sha256[:2], sha256, name)
+                full_path = os.path.join(self.path, path)
+                if not os.path.isdir(os.path.dirname(full_path)):
+                    os.makedirs(os.path.dirname(full_path))
+                os.rename(tmp_path, full_path)
+                self.by_hash[sha256] = path
+            self.by_id[file['id']] = path
+            with open(self.index_path(), 'a') as f:
+                f.write(json.dumps({'id': file['id'], 'sha256': sha256,
+                                    'path': path}))
+                f.write('\n')
+        return path
+
+    def download_pool(self):
+        # started on first use, shared by every with_files()
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPool(self.workers)
+            return self.pool
+
+    def count(self, name, value=1):
+        if self.metrics is not None:
+            self.metrics.add(name, value)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.session.close()
+
+
+def with_files(messages, store, wanted=None, window=DEFAULT_FILE_WINDOW):
+    # Adds the local paths of the files every wanted message shares, in
+    # FILE_PATHS_COLUMN. The files are downloaded on the store's pool while
+    # at most `window` messages wait for them; other items are passed on as
+    # they are.
+    def fetch(msg):
+        paths = [store.local_path(file) for file in msg.get('files') or ()]
+        return ';'.join(path for path in paths if path)
+
+    def has_files(msg):
+        return (isinstance(msg, dict) and bool(msg.get('files')) and
+                (wanted is None or wanted(msg)))
+
+    for msg, paths in ordered_imap(fetch, messages, store.download_pool(),
+                                   window, has_files):
+        if isinstance(msg, dict):
+            msg[FILE_PATHS_COLUMN] = paths or ''
+        yield msg
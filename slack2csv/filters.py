@@ -0,0 +1,41 @@
+import re
+
+
+MATCH_MODES = ('prefix', 'substring', 'regex')
+
+# message subtypes that are never exported unless asked for
+DEFAULT_EXCLUDED_SUBTYPES = ('bot_message',)
+
+
+def compile_text_match(text, match='prefix'):
+    if not text:
+        return None
+    if match == 'prefix':
+        return lambda msgText: msgText.startswith(text)
+    if match == 'substring':
+        return lambda msgText: text in msgText
+    if match == 'regex':
+        return re.compile(text).search
+    raise ValueError("Unknown match mode: ", match)
+
+
+def compile_filter(text='', match='prefix', users=None,
+                   exclude_subtypes=DEFAULT_EXCLUDED_SUBTYPES):
+    # Builds the predicate deciding which messages are exported, once per
+    # run: messages need a user (one of `users` if given), must not have an
+    # excluded subtype and their text has to match. It leaves the messages
+    # alone, so it can be asked more than once; the subtype column the
+    # original filter dropped is dropped by the exporters on write.
+    matches = compile_text_match(text, match)
+    excluded = frozenset(exclude_subtypes or ())
+    users = frozenset(users) if users else None
+
+    def keep(msg):
+        if msg.get('subtype') in excluded:
+            return False
+        msgUser = msg.get('user')
+        if msgUser is None or (users is not None and msgUser not in users):
+            return False
+        return matches is None or bool(matches(msg.get('text') or ''))
+
+    return keep
@@ -0,0 +1,128 @@
+# Record and replay Slack API responses as they were, request by request,
+# for tests and benchmarks that have to run offline and give the same
+# result every time. A fixture is a gzipped JSON Lines file of
+# {"request": ..., "response": ...} pairs with every token scrubbed.
+import collections
+import json
+import re
+import threading
+import time
+
+from .archive import request_params
+from .compression import open_input_file, open_output_file
+from .fastjson import loads
+from .slack2csv import api_method
+
+# Slack tokens, e.g. xoxb-..., xoxp-... or xoxe.xoxp-...
+TOKEN = re.compile(r'xox[a-z](?:\.xox[a-z])?-[A-Za-z0-9-]+')
+SCRUBBED = 'xoxx-scrubbed'
+
+# parameters that move with the clock, e.g. an oldest set by --past_days
+WINDOW_PARAMS = ('oldest', 'latest')
+
+
+def scrub(text):
+    return TOKEN.sub(SCRUBBED, text)
+
+
+def request_key(url, window=True):
+    # the method and parameters of a request, without its token and in a
+    # fixed order, e.g. "conversations.history?channel=C1&oldest=1"; also
+    # without its time window unless `window`
+    params = request_params(url)
+    params.pop('token', None)
+    if not window:
+        for name in WINDOW_PARAMS:
+            params.pop(name, None)
+    return api_method(url) + '?' + '&'.join(
+        '{0}={1}'.format(k, params[k]) for k in sorted(params))
+
+
+class RecordingClient(object):
+    # Wraps a client and writes every response it gets to a fixture file.
+    # Safe to share between threads; close() closes the wrapped client too.
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.metrics = getattr(client, 'metrics', None)
+        self.json_loads = getattr(client, 'json_loads', None)
+        self.limiter = getattr(client, 'limiter', None)
+        self.recorded = 0
+        self.lock = threading.Lock()
+        self.fixture = open_output_file(path, 'w', 'gzip')
+
+    def get_json(self, url):
+        resp = self.client.get_json(url)
+        line = scrub(json.dumps({'request': request_key(url),
+                                 'response': resp}, sort_keys=True))
+        with self.lock:
+            self.fixture.write(line)
+            self.fixture.write('\n')
+            self.recorded += 1
+        return resp
+
+    def summary(self):
+        return "{0}, recorded {1} responses to {2}".format(
+            self.client.summary(), self.recorded, self.path)
+
+    def close(self):
+        with self.lock:
+            self.fixture.close()
+        self.client.close()
+
+
+class ReplayClient(object):
+    # Answers requests from a fixture file, waiting `latency` seconds for
+    # each as if it went to Slack. A request made more than once gets the
+    # responses recorded for it in turn, then the last one again. Requests
+    # recorded for another time window, e.g. an earlier run of the same
+    # --past_days, still match. Responses are kept as JSON text and decoded
+    # for every request, like the bodies SlackClient receives.
+
+    def __init__(self, path, latency=0.0, metrics=None):
+        self.path = path
+        self.latency = latency
+        self.metrics = metrics
+        self.json_loads = loads
+        self.limiter = None
+        self.requests = 0
+        self.responses = collections.defaultdict(collections.deque)
+        self.lock = threading.Lock()
+        with open_input_file(path, 'gzip') as fixture:
+            for line in fixture:
+                if line.strip():
+                    recorded = json.loads(line)
+                    body = json.dumps(recorded['response'])
+                    key = recorded['request']
+                    self.responses[key].append(body)
+                    loose_key = request_key(key, window=False)
+                    if loose_key != key:
+                        self.responses[loose_key].append(body)
+
+    def get_json(self, url):
+        key = request_key(url)
+        if key not in self.responses:
+            key = request_key(url, window=False)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.metrics is not None:
+            self.metrics.observe('request_seconds', self.latency,
+                                 method=api_method(url))
+        with self.lock:
+            self.requests += 1
+            responses = self.responses.get(key)
+            if not responses:
+                return {"ok": False, "error": "not_in_fixture: " + key}
+            if len(responses) > 1:
+                body = responses.popleft()
+            else:
+                body = responses[0]
+        return self.json_loads(body)
+
+    def summary(self):
+        return "Replayed {0} requests from {1}".format(self.requests,
+                                                      self.path)
+
+    def close(self):
+        pass
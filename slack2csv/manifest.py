@@ -0,0 +1,263 @@
+# Runs the exports listed in a manifest on a pool of processes, one Slack
+# token per process. Slack rate limits each token on its own, so exports
+# for different workspaces run side by side, while the jobs of one token
+# run one after the other in the same process and share its pacing.
+import argparse
+from collections import OrderedDict
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .cli import parse_args
+from .metrics import write_atomic
+
+# job results are sent to the driver on this queue in pool processes
+worker_queue = None
+
+
+def load_manifest(path):
+    # a JSON or, with PyYAML, YAML file like
+    #   {"defaults": {"past_days": 7},
+    #    "jobs": [{"name": "acme", "token_env": "ACME_TOKEN",
+    #              "channels": "*", "filename": "acme-{channel}.csv"}]}
+    with open(path) as f:
+        text = f.read()
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("YAML manifests need PyYAML, install it with: "
+                              "pip install slack2csv[yaml]")
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+
+def job_argv(options):
+    # {"channels": "*", "threads": true} -> ["--channels", "*", "--threads"]
+    argv = []
+    for name, value in sorted(options.items()):
+        if value is None or value is False:
+            continue
+        argv.append('--' + name)
+        if value is not True:
+            argv.append(str(value))
+    return argv
+
+
+def manifest_jobs(manifest, environ=None):
+    # The jobs of a manifest as {'name', 'token', 'argv'} dicts, each one
+    # checked like the command line would; options a job leaves out are
+    # taken from "defaults", and "token_env" names the environment variable
+    # holding the token, so that tokens need not be written in the manifest.
+    if environ is None:
+        environ = os.environ
+    defaults = manifest.get('defaults') or {}
+    jobs = []
+    names = set()
+    for i, job in enumerate(manifest.get('jobs') or []):
+        options = dict(defaults)
+        options.update(job)
+        name = str(options.pop('name', None) or 'job{0}'.format(i + 1))
+        if name in names:
+            raise ValueError("Duplicate manifest job name: ", name)
+        names.add(name)
+        token_env = options.pop('token_env', None)
+        if token_env:
+            if not environ.get(token_env):
+                raise ValueError("Manifest job token variable is not set: ",
+                                 name, token_env)
+            options['token'] = environ[token_env]
+        argv = job_argv(options)
+        try:
+            parse_args(argv)
+        except SystemExit:
+            # the parser has already said what is wrong with it
+            raise ValueError("Invalid manifest job: ", name)
+        jobs.append({'name': name, 'token': options.get('token'),
+                     'argv': argv})
+    if not jobs:
+        raise ValueError("Manifest has no jobs")
+    return jobs
+
+
+def group_by_token(jobs):
+    groups = OrderedDict()
+    for job in jobs:
+        groups.setdefault(job['token'], []).append(job)
+    return list(groups.values())
+
+
+def metrics_totals(summary):
+    # the counts of a Metrics.as_dict() the run summary reports
+    totals = {'rows_written': 0, 'rows_filtered': 0, 'requests': 0,
+              'rate_limited': 0, 'bytes_received': 0, 'sleep_seconds': 0.0}
+    for counter in summary.get('counters', ()):
+        if counter['name'] in totals:
+            totals[counter['name']] += counter['value']
+    for timer in summary.get('timers', ()):
+        if timer['name'] == 'request_seconds':
+            totals['requests'] += timer['count']
+        elif timer['name'] == 'sleep_seconds':
+            totals['sleep_seconds'] += timer['sum']
+    return totals
+
+
+def run_job(job, log_dir, metrics_dir):
+    # Runs one job in this process with its output in log_dir/<name>.log
+    # and returns its summary.
+    from .slack2csv import run
+
+    argv = list(job['argv'])
+    if '--metrics_json' in argv:
+        metrics_path = argv[argv.index('--metrics_json') + 1]
+    else:
+        metrics_path = os.path.join(metrics_dir, job['name'] + '.json')
+        argv += ['--metrics_json', metrics_path]
+    stdout = sys.stdout
+    log = None
+    if log_dir:
+        log = open(os.path.join(log_dir, job['name'] + '.log'), 'a')
+        sys.stdout = log
+    started = time.time()
+    error = None
+    try:
+        ok = run(parse_args(argv)) is not False
+    except Exception as e:
+        ok = False
+        error = repr(e)
+    finally:
+        sys.stdout = stdout
+        if log is not None:
+            log.close()
+    result = {'name': job['name'], 'ok': ok, 'error': error,
+              'seconds': time.time() - started}
+    try:
+        with open(metrics_path) as f:
+            result.update(metrics_totals(json.load(f)))
+    except (IOError, OSError, ValueError):
+        result.update(metrics_totals({}))
+    return result
+
+
+def run_group(jobs, log_dir, metrics_dir, report):
+    for job in jobs:
+        report(run_job(job, log_dir, metrics_dir))
+
+
+def init_worker(results):
+    global worker_queue
+    worker_queue = results
+
+
+def run_pooled_group(jobs, log_dir, metrics_dir):
+    run_group(jobs, log_dir, metrics_dir, worker_queue.put)
+
+
+def run_manifest(jobs, processes=None, log_dir=None, progress=True):
+    # Runs the jobs on up to `processes` processes, one per token (all of
+    # them by default; 1 runs everything in this process), printing a line
+    # as every job finishes. Returns the combined run summary.
+    groups = group_by_token(jobs)
+    processes = min(processes or len(groups), len(groups))
+    if log_dir and not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    metrics_dir = tempfile.mkdtemp(prefix='slack2csv-manifest-')
+    started = time.time()
+    results = []
+
+    def report(result):
+        results.append(result)
+        if progress:
+            print("[{0}/{1}] {2}".format(len(results), len(jobs),
+                                         describe(result)))
+            sys.stdout.flush()
+
+    try:
+        if processes == 1:
+            for group in groups:
+                run_group(group, log_dir, metrics_dir, report)
+        else:
+            results_queue = multiprocessing.Queue()
+            pool = multiprocessing.Pool(processes, init_worker,
+                                        (results_queue,))
+            try:
+                pending = [pool.apply_async(run_pooled_group,
+                                            (group, log_dir, metrics_dir))
+                           for group in groups]
+                pool.close()
+                while len(results) < len(jobs):
+                    try:
+                        report(results_queue.get(timeout=0.5))
+                    except queue.Empty:
+                        for result in pending:
+                            if result.ready():
+                                # raises what a worker died of
+                                result.get()
+                pool.join()
+            finally:
+                pool.terminate()
+    finally:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+    order = dict((job['name'], i) for i, job in enumerate(jobs))
+    results.sort(key=lambda result: order[result['name']])
+    summary = metrics_totals({})
+    for result in results:
+        for name in list(summary):
+            summary[name] += result[name]
+    summary.update({'ok': all(result['ok'] for result in results),
+                    'seconds': time.time() - started,
+                    'processes': processes, 'jobs': results})
+    return summary
+
+
+def describe(result):
+    if not result['ok']:
+        return "{0}: failed in {1:.1f}s {2}".format(
+            result['name'], result['seconds'], result['error'] or '')
+    return ("{0}: {1} rows, {2} requests ({3} rate limited) "
+            "in {4:.1f}s".format(result['name'], result['rows_written'],
+                                 result['requests'], result['rate_limited'],
+                                 result['seconds']))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='slack2csv-manifest',
+        description='run the slack2csv exports listed in a JSON or YAML '
+                    'manifest, one process per Slack token')
+    parser.add_argument('manifest', help='manifest file')
+    parser.add_argument(
+        '--processes', type=int,
+        help='processes to run tokens on, by default one per token')
+    parser.add_argument(
+        '--log_dir', help='write the output of every job to <name>.log here')
+    parser.add_argument(
+        '--summary_json', help='write the combined run summary to this file')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    jobs = manifest_jobs(load_manifest(args.manifest))
+    summary = run_manifest(jobs, args.processes, args.log_dir)
+    ok = len([result for result in summary['jobs'] if result['ok']])
+    print("Finished {0} of {1} jobs: {2} rows, {3} requests ({4} rate "
+          "limited) in {5:.1f}s on {6} processes".format(
+              ok, len(jobs), summary['rows_written'], summary['requests'],
+              summary['rate_limited'], summary['seconds'],
+              summary['processes']))
+    if args.summary_json:
+        write_atomic(args.summary_json,
+                     json.dumps(summary, indent=2, sort_keys=True) + '\n')
+    return 0 if summary['ok'] else 1
+
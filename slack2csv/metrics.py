@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+
+
+class Metrics(object):
+    # Counters and timers of one export run, e.g. per request latency,
+    # bytes received and rows written, optionally labelled like
+    # add('bytes_received', 512, method='users.list'). Safe to share between
+    # threads. Nothing is measured unless a Metrics is handed to the client.
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                timer = self.timers[key] = [0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def value(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def as_dict(self):
+        with self.lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value
+                        in sorted(self.counters.items())]
+            timers = [{'name': name, 'labels': dict(labels), 'count': count,
+                       'sum': total, 'max': longest}
+                      for (name, labels), (count, total, longest)
+                      in sorted(self.timers.items())]
+        return {
+            'started': self.started,
+            'run_seconds': time.time() - self.started,
+            'counters': counters,
+            'timers': timers,
+        }
+
+    def prometheus(self, prefix='slack2csv'):
+        # the Prometheus text exposition format, as read by node_exporter's
+        # textfile collector
+        summary = self.as_dict()
+        lines = []
+
+        def declare(name, kind):
+            line = '# TYPE {0} {1}'.format(name, kind)
+            if line not in lines:
+                lines.append(line)
+
+        def sample(name, labels, value):
+            label_text = ','.join('{0}="{1}"'.format(k, v)
+                                  for k, v in sorted(labels.items()))
+            if label_text:
+                name += '{' + label_text + '}'
+            lines.append('{0} {1}'.format(name, repr(float(value))))
+
+        for counter in summary['counters']:
+            name = prefix + '_' + counter['name'] + '_total'
+            declare(name, 'counter')
+            sample(name, counter['labels'], counter['value'])
+        for timer in summary['timers']:
+            name = prefix + '_' + timer['name']
+            declare(name, 'summary')
+            sample(name + '_sum', timer['labels'], timer['sum'])
+            sample(name + '_count', timer['labels'], timer['count'])
+        for name, value in (('run_seconds', summary['run_seconds']),
+                            ('last_run_timestamp_seconds',
+                             summary['started'])):
+            declare(prefix + '_' + name, 'gauge')
+            sample(prefix + '_' + name, {}, value)
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.as_dict(), indent=2,
+                                      sort_keys=True) + '\n')
+
+    def write_prometheus(self, path, prefix='slack2csv'):
+        write_atomic(path, self.prometheus(prefix))
+
+
+def write_atomic(path, text):
+    # readers such as the textfile collector never see a half written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.rename(tmp_path, path)
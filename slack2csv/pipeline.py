@@ -0,0 +1,89 @@
+import collections
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# items per chunk handed from a prefetch thread to its consumer
+PREFETCH_CHUNK_SIZE = 1000
+
+
+def ordered_imap(func, items, pool, window, wanted=None):
+    # Runs func(item) on a thread pool for the items that are wanted, and
+    # yields (item, result) pairs in input order; result is None for items
+    # that were not wanted. At most `window` items are held at a time, and
+    # items are handed on as soon as everything before them is done.
+    pending = collections.deque()
+
+    def ready():
+        return pending and (pending[0][1] is None or pending[0][1].ready())
+
+    for item in items:
+        if wanted is None or wanted(item):
+            pending.append((item, pool.apply_async(func, (item,))))
+        else:
+            pending.append((item, None))
+        while len(pending) > window or ready():
+            item, result = pending.popleft()
+            yield item, None if result is None else result.get()
+
+    while pending:
+        item, result = pending.popleft()
+        yield item, None if result is None else result.get()
+
+
+def prefetch(items, chunks, boundary=None, chunk_size=PREFETCH_CHUNK_SIZE):
+    # Iterates items on a background thread, at most `chunks` chunks ahead
+    # of the caller, so that producing the next items (e.g. fetching the
+    # next page) overlaps with consuming the current ones. A chunk ends
+    # after chunk_size items or after an item boundary(item) is true for.
+    # Errors are raised to the caller, and closing the returned generator
+    # stops the thread.
+    chunk_queue = queue.Queue(maxsize=chunks)
+    stop = threading.Event()
+    done = object()
+
+    def put(chunk):
+        while not stop.is_set():
+            try:
+                chunk_queue.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        chunk = []
+        try:
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= chunk_size or (boundary is not None and
+                                                boundary(item)):
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if not chunk or put(chunk):
+                put(done)
+        except Exception as e:
+            put(e)
+        finally:
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            chunk = chunk_queue.get()
+            if chunk is done:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            for item in chunk:
+                yield item
+    finally:
+        stop.set()
@@ -0,0 +1,101 @@
+import threading
+import time
+
+
+# Slack's documented rate limit tiers, in requests per minute
+TIER_RATES = {
+    1: 1,
+    2: 20,
+    3: 50,
+    4: 100,
+}
+
+# tier of each Slack API method we call
+METHOD_TIERS = {
+    'conversations.history': 3,
+    'conversations.list': 2,
+    'conversations.replies': 3,
+    'search.messages': 2,
+    'users.list': 2,
+}
+
+# how many requests each tier may fire back to back before pacing starts
+TIER_BURST = 3
+
+
+class TokenBucket(object):
+    # A token bucket refilled at `rate` tokens per second. Tokens are
+    # reserved up front, so the balance can go negative and each caller
+    # is told how long to wait for its own token.
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self.blocked_until = 0.0
+
+    def reserve(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        delay = 0.0
+        if self.tokens < 0:
+            delay = -self.tokens / self.rate
+        return max(delay, self.blocked_until - now)
+
+
+class RateLimiter(object):
+    # Paces requests per Slack API method, each at the rate of its tier,
+    # since Slack limits every method on its own, and keeps track of how
+    # long callers were held back. Safe to share between threads.
+
+    def __init__(self, rates=None, burst=TIER_BURST):
+        if rates is None:
+            rates = TIER_RATES
+        self.rates = dict(rates)
+        self.burst = burst
+        self.buckets = {}
+        self.throttled_seconds = 0.0
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+
+    def bucket(self, method):
+        # the bucket of `method`, None for methods that are not paced;
+        # call with the lock held
+        if method not in self.buckets:
+            per_minute = self.rates.get(METHOD_TIERS.get(method))
+            self.buckets[method] = None
+            if per_minute is not None:
+                self.buckets[method] = TokenBucket(per_minute / 60.0,
+                                                   self.burst)
+        return self.buckets[method]
+
+    def reserve(self, method):
+        # Returns the seconds the caller has to wait before calling `method`
+        with self.lock:
+            bucket = self.bucket(method)
+            if bucket is None:
+                return 0.0
+            delay = bucket.reserve(time.time())
+            self.throttled_seconds += delay
+        return delay
+
+    def wait(self, method):
+        delay = self.reserve(method)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def penalize(self, method, retry_after):
+        # Slack answered 429: hold back every caller of this method until
+        # Retry-After has passed, and return how long to wait.
+        with self.lock:
+            self.rate_limited += 1
+            self.throttled_seconds += retry_after
+            bucket = self.bucket(method)
+            if bucket is not None:
+                bucket.blocked_until = max(bucket.blocked_until,
+                                           time.time() + retry_after)
+        return retry_after
@@ -0,0 +1,23 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .defaults import RETRY_BACKOFF_FACTOR, RETRY_STATUS_CODES
+
+
+def pooled_session(pool_size, retries):
+    # A requests Session keeping up to pool_size keep-alive connections per
+    # host, which retries connection errors and 5xx answers with backoff.
+    # 429s are left to the caller, e.g. SlackClient.get() shares them with
+    # its RateLimiter.
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=retries,
+                          backoff_factor=RETRY_BACKOFF_FACTOR,
+                          status_forcelist=RETRY_STATUS_CODES,
+                          respect_retry_after_header=False))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
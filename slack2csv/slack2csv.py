@@ -1,107 +1,848 @@
-import argparse
-import csv
 from datetime import datetime, timedelta
+from fnmatch import fnmatchcase
+import functools
 import json
+from multiprocessing.pool import ThreadPool
 import os
 from progress.spinner import Spinner
 import requests
+import threading
 import time
 
-
+from .defaults import (DEFAULT_POOL_SIZE, DEFAULT_PREFETCH_PAGES,
+                       DEFAULT_REQUEST_TIMEOUT, DEFAULT_RETRIES,
+                       DEFAULT_WORKERS)
+from .enrich import compile_enrich
+from .fastjson import fast_loads, project
+from .files import FILE_PATHS_COLUMN, FileStore, with_files
+from .filters import compile_filter
+from .metrics import Metrics
+from .pipeline import ordered_imap, prefetch
+from .ratelimit import RateLimiter
+from .sessions import pooled_session
+from .state import ExportState
+from .writers import (DEFAULT_OPEN_PARTITIONS, open_csv_writer,
+                      open_partitioned_writer, open_writer)
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from urllib.parse import quote, urlparse
+except ImportError:
+    from urllib import quote
+    from urlparse import urlparse
+
+
+# seconds to back off after a 429 that carries no Retry-After header
 QUERY_API_TIMEOUT = 2
 
+# pace requests to Slack's rate limit tiers; the tests turn this off
+PACE_REQUESTS = True
+
+SLACK_API_URL = "https://slack.com/api/"
+
+# message fields the export itself reads (checkpoints, threads and the
+# filter), kept by --columns projections whatever the output columns are
+PIPELINE_FIELDS = ('reply_count', 'subtype', 'text', 'thread_ts', 'ts',
+                   'user')
+
+# fields of search.messages results that conversations.history lacks
+SEARCH_ONLY_FIELDS = ('channel', 'iid', 'permalink', 'score', 'team')
+
+# pages each time slice may fetch ahead of the writer with --slices
+SLICE_BUFFER_PAGES = 20
+
+# thread reply fetching with --threads: concurrent conversations.replies
+# walks, and how many messages may wait for their replies
+DEFAULT_REPLY_WORKERS = 4
+DEFAULT_REPLY_WINDOW = 1000
+
+CHANNEL_PLACEHOLDER = "{channel}"
+
+# conversations per conversations.list page, the most Slack recommends;
+# its default of 100 means twice the pages on Tier 2's 20 a minute
+LIST_PAGE_SIZE = 200
+
+
+def api_method(url):
+    return urlparse(url).path.rsplit('/', 1)[-1]
+
+
+class SlackClient(object):
+    # Holds a pooled, keep-alive HTTP session so that every page of every
+    # Slack API call reuses the same TCP/TLS connections, and paces the
+    # calls to Slack's rate limit tiers. Given a Metrics, it also records
+    # what every request cost. json_loads decodes the raw response body,
+    # e.g. fastjson.fast_loads(); by default requests decodes it. Given an
+    # archive.PageArchive, every decoded page is recorded in it.
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_REQUEST_TIMEOUT, retries=DEFAULT_RETRIES,
+                 limiter=None, pace=True, metrics=None, json_loads=None,
+                 archive=None):
+        self.timeout = timeout
+        self.retries = retries
+        if limiter is None:
+            limiter = RateLimiter() if pace else RateLimiter(rates={})
+        self.limiter = limiter
+        self.metrics = metrics
+        self.json_loads = json_loads
+        self.archive = archive
+        self.requests = 0
+        self.fetch_seconds = 0.0
+        self.lock = threading.Lock()
+        self.session = pooled_session(pool_size, retries)
+
+    def get(self, url):
+        method = api_method(url)
+        attempts = 0
+        metrics = self.metrics
+        while True:
+            delay = self.limiter.wait(method)
+            start = time.time()
+            r = self.session.get(url, timeout=self.timeout)
+            elapsed = time.time() - start
+            with self.lock:
+                self.fetch_seconds += elapsed
+                self.requests += 1
+            if metrics is not None:
+                if delay > 0:
+                    metrics.observe('sleep_seconds', delay, reason='pace')
+                metrics.observe('request_seconds', elapsed, method=method)
+                metrics.add('bytes_received', len(r.content), method=method)
+            if r.status_code != 429:
+                return r
+            attempts += 1
+            if attempts > self.retries:
+                raise ValueError("Rate limited by Slack: ", method)
+            retry_after = float(r.headers.get('Retry-After',
+                                              QUERY_API_TIMEOUT))
+            delay = self.limiter.penalize(method, retry_after)
+            if metrics is not None:
+                metrics.add('rate_limited', method=method)
+                metrics.observe('sleep_seconds', delay, reason='retry_after')
+            time.sleep(delay)
+
+    def get_json(self, url):
+        r = self.get(url)
+        if self.metrics is None:
+            resp = self.decode(r)
+        else:
+            start = time.time()
+            resp = self.decode(r)
+            self.metrics.observe('decode_seconds', time.time() - start,
+                                 method=api_method(url))
+        if self.archive is not None:
+            self.archive.record(url, resp)
+        return resp
+
+    def decode(self, r):
+        if self.json_loads is None:
+            return r.json()
+        return self.json_loads(r.content)
+
+    def summary(self):
+        return ("Spent {0:.1f}s fetching and {1:.1f}s throttled over {2} "
+                "requests ({3} rate limited)".format(
+                    self.fetch_seconds,
+                    self.limiter.throttled_seconds,
+                    self.requests,
+                    self.limiter.rate_limited))
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+
 
-def paged_query(url):
+def get_client(client=None):
+    global _default_client
+    if client is not None:
+        return client
+    if _default_client is None:
+        _default_client = SlackClient(pace=PACE_REQUESTS)
+    return _default_client
+
+
+def paged_query(url, client=None, cursor=None):
+    client = get_client(client)
     query_url = url
+    if cursor:
+        query_url = url + "&cursor=" + cursor
     next_cursor = True
     while next_cursor:
-        r = requests.get(query_url)
-        resp = r.json()
+        resp = client.get_json(query_url)
 
         yield resp
 
         next_cursor = resp.get("response_metadata", {}).get("next_cursor", None)
         if next_cursor:
             query_url = url + "&cursor=" + next_cursor
-        else:
-            break
-        time.sleep(QUERY_API_TIMEOUT)
 
 
-def lookup_user_id_by_name(token, user_name):
-    url = "https://slack.com/api/users.list?token=" + token
-    for user_resp in paged_query(url):
+def list_users(token, client=None):
+    url = SLACK_API_URL + "users.list?token=" + token
+    for user_resp in paged_query(url, client):
 
         user_list_parsed = user_resp["members"]
 
         for user in user_list_parsed:
-            if user["name"] == user_name:
-                return user["id"]
+            yield user
+
+
+def lookup_user_id_by_name(token, user_name, client=None):
+    for user in list_users(token, client):
+        if user["name"] == user_name:
+            return user["id"]
 
     return ""
 
 
-def lookup_channel_id_by_name(token, channel_name, types=None):
-    url = "https://slack.com/api/conversations.list?token=" + token
+def list_conversations(token, types=None, client=None, exclude_archived=False):
+    url = (SLACK_API_URL + "conversations.list?token=" + token +
+           "&limit=" + str(LIST_PAGE_SIZE))
     if types is not None:
         url += "&types=" + types
-    for channel_resp in paged_query(url):
+    if exclude_archived:
+        url += "&exclude_archived=true"
+    for channel_resp in paged_query(url, client):
 
         channel_list_parsed = channel_resp["channels"]
 
         for channel in channel_list_parsed:
-            if channel_name == channel.get("name", channel.get("user", None)):
-                return channel["id"]
+            yield channel
+
+
+def conversation_name(channel):
+    return channel.get("name", channel.get("user", None))
+
+
+def lookup_channel_id_by_name(token, channel_name, types=None, client=None):
+    for channel in list_conversations(token, types, client):
+        if channel_name == conversation_name(channel):
+            return channel["id"]
 
     return ""
 
 
-def fetch_from_slack(token, channel, oldest):
+def select_conversations(token, patterns, types=None, client=None,
+                         exclude_archived=False, min_members=None,
+                         exported_until=None):
+    # patterns is a comma separated list of channel ids or shell style
+    # globs on the channel name, e.g. "general,team-*". Conversations with
+    # fewer than min_members members, or not updated since
+    # exported_until(channel id) returns, are left out.
+    patterns = [p.strip() for p in patterns.split(',') if p.strip()]
+    for channel in list_conversations(token, types, client, exclude_archived):
+        # also checked here for archives replayed without the filter
+        if exclude_archived and channel.get("is_archived"):
+            continue
+        if (min_members and
+                channel.get("num_members", min_members) < min_members):
+            continue
+        if exported_until is not None and not is_updated_since(
+                channel, exported_until(channel["id"])):
+            continue
+        name = conversation_name(channel) or ""
+        for pattern in patterns:
+            if pattern == channel["id"] or fnmatchcase(name, pattern):
+                yield channel
+                break
+
+
+def is_updated_since(channel, ts):
+    # conversations.list gives `updated` in milliseconds; conversations
+    # without it are always exported
+    updated = channel.get("updated")
+    return ts is None or updated is None or updated / 1000.0 > float(ts)
+
+
+def history_url(token, channel, oldest, latest=None):
+    # oldest is rounded down, so that a walk resumed after the ts of the
+    # last exported message gets everything later in the same second
+    url = (SLACK_API_URL + "conversations.history?token=" + token +
+           "&channel=" + channel +
+           "&count=100&inclusive=true&oldest=" + str(int(float(oldest))))
+    if latest is not None:
+        url += "&latest=" + str(latest)
+    return url
+
+
+class PageDone(object):
+    # Marks the end of a history page in a message stream, for consumers
+    # that checkpoint a walk once everything before it has been written.
+
+    def __init__(self, next_cursor, newest=None):
+        self.next_cursor = next_cursor
+        self.newest = newest
+
+
+def message_fields(columns):
+    # the top level message fields needed to write these output columns
+    return frozenset(PIPELINE_FIELDS).union(
+        column.split('.', 1)[0] for column in columns)
+
+
+def fetch_from_slack(token, channel, oldest, client=None, quiet=False,
+                     cursor=None, page_markers=False, latest=None,
+                     fields=None):
+    # With page_markers, a PageDone follows the messages of every page.
+    # With fields, messages only keep those top level keys, so that large
+    # blocks and attachments that are never written are dropped with the
+    # page.
     n_messages = 0
-    newest = None
     oldest = float(oldest)
+    newest = oldest
     oldest_ts = str(datetime.fromtimestamp(oldest))
-    spinner = Spinner('Fetching history for ' +
-                      channel + ' from ' + oldest_ts + ' ')
+    spinner = None
+    if not quiet:
+        spinner = Spinner('Fetching history for ' +
+                          channel + ' from ' + oldest_ts + ' ')
 
-    url = ("https://slack.com/api/conversations.history?token=" + token +
-           "&channel=" + channel +
-           "&count=100&inclusive=true&oldest=" + str(round(oldest)))
+    url = history_url(token, channel, oldest, latest)
     # records are paged oldest to newest, however the message order
     # within a single response is newest to oldest
-    for message_resp in paged_query(url):
+    for message_resp in paged_query(url, client, cursor):
         if not message_resp['ok']:
             raise ValueError("Error fetching channel history from Slack: ",
                              message_resp["error"])
         messages = message_resp['messages']
-        newest = messages[0].get('ts', time.time())
+        if messages:
+            newest = messages[0].get('ts', time.time())
         n_messages += len(messages)
 
         for message in reversed(messages):
-            yield message
-        spinner.next()
-    print("\nFetched {0} total messages from {1} to {2}".format(
-                n_messages,
-                oldest_ts,
-                str(datetime.fromtimestamp(float(newest)))))
-
-
-def main():
-    parser = argparse.ArgumentParser(description='slack2csv')
-    parser.add_argument('--text', help='text to search for', default='')
-    parser.add_argument(
-        '--past_days', help='days to go back', default='1')
-    requiredNamed = parser.add_argument_group('required named arguments')
-    requiredNamed.add_argument(
-        '--token', help='Slack API token', required=True)
-    requiredNamed.add_argument(
-        '--filename', help='CSV filename', required=True)
-    mutuallyExclusiveRequired = parser.add_mutually_exclusive_group(required=True)
-    mutuallyExclusiveRequired.add_argument(
-        '--channel', help='Slack channel id or name')
-    mutuallyExclusiveRequired.add_argument(
-        '--user', help='Slack user id or name')
-    args = parser.parse_args()
+            yield message if fields is None else project(message, fields)
+        if page_markers:
+            yield PageDone(message_resp.get("response_metadata", {}).get(
+                "next_cursor", None), messages[0]['ts'] if messages else None)
+        if spinner is not None:
+            spinner.next()
+    if not quiet:
+        print("\nFetched {0} total messages from {1} to {2}".format(
+                    n_messages,
+                    oldest_ts,
+                    str(datetime.fromtimestamp(float(newest)))))
+
+
+def slice_bounds(oldest, latest, slices):
+    # whole seconds, so that every slice boundary is exact in the URL
+    oldest = int(round(float(oldest)))
+    step = (float(latest) - oldest) / slices
+    return [oldest] + [int(oldest + step * i) for i in range(1, slices)]
+
+
+def fetch_from_slack_sliced(token, channel, oldest, slices, client=None,
+                            quiet=False, buffer_pages=SLICE_BUFFER_PAGES,
+                            fields=None):
+    # Splits [oldest, now] into `slices` time windows and walks them
+    # concurrently, then streams the messages back oldest to newest, the
+    # same order fetch_from_slack yields them in. Each slice buffers at
+    # most `buffer_pages` pages ahead of the consumer.
+    bounds = slice_bounds(oldest, time.time(), slices)
+    queues = [queue.Queue(maxsize=buffer_pages) for _ in bounds]
+    stop = threading.Event()
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch(i):
+        q = queues[i]
+        # the last slice stays open ended, like an unsliced walk
+        latest = bounds[i + 1] if i + 1 < len(bounds) else None
+        page = []
+        try:
+            for msg in fetch_from_slack(token, channel, bounds[i], client,
+                                        quiet=True, page_markers=True,
+                                        latest=latest, fields=fields):
+                if stop.is_set():
+                    return
+                if isinstance(msg, PageDone):
+                    if page:
+                        put(q, page)
+                        page = []
+                # a message right on the boundary belongs to the next slice
+                elif latest is None or float(msg['ts']) < latest:
+                    page.append(msg)
+            put(q, None)
+        except Exception as e:
+            put(q, e)
+
+    threads = []
+    for i in range(len(bounds)):
+        thread = threading.Thread(target=fetch, args=(i,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    n_messages = 0
+    try:
+        for q in queues:
+            while True:
+                item = q.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                n_messages += len(item)
+                for message in item:
+                    yield message
+    finally:
+        stop.set()
+    if not quiet:
+        print("Fetched {0} total messages from {1} in {2} slices".format(
+                    n_messages,
+                    str(datetime.fromtimestamp(bounds[0])),
+                    len(bounds)))
+
+
+def search_messages(token, query, client=None):
+    # search.messages pages by page number rather than cursor; results are
+    # requested oldest first to match conversations.history
+    client = get_client(client)
+    url = (SLACK_API_URL + "search.messages?token=" + token +
+           "&query=" + quote(query) +
+           "&count=100&sort=timestamp&sort_dir=asc")
+    page = 1
+    pages = 1
+    while page <= pages:
+        resp = client.get_json(url + "&page=" + str(page))
+        if not resp['ok']:
+            raise ValueError("Error searching messages in Slack: ",
+                             resp["error"])
+        for match in resp['messages']['matches']:
+            yield match
+        pages = resp['messages'].get('paging', {}).get('pages', 1)
+        page += 1
+
+
+def search_query(text, channel, oldest):
+    # after: is exclusive and day granular, so ask for a day more and
+    # drop the extra messages afterwards
+    after = datetime.fromtimestamp(float(oldest)) - timedelta(days=1)
+    return '"{0}" in:<#{1}> after:{2}'.format(
+        text.replace('"', ''), channel, after.strftime('%Y-%m-%d'))
+
+
+def fetch_from_search(token, channel, oldest, text, client=None):
+    # Lets Slack's search find candidate messages for `text` instead of
+    # downloading the whole history; the export filter still decides which
+    # of them are written.
+    oldest = float(oldest)
+    for match in search_messages(token, search_query(text, channel, oldest),
+                                 client):
+        if float(match.get('ts', 0)) < oldest:
+            continue
+        for field in SEARCH_ONLY_FIELDS:
+            match.pop(field, None)
+        yield match
+
+
+def replies_url(token, channel, thread_ts):
+    return (SLACK_API_URL + "conversations.replies?token=" + token +
+            "&channel=" + channel + "&ts=" + thread_ts + "&limit=100")
+
+
+def fetch_replies(token, channel, thread_ts, client=None):
+    # the replies of one thread, oldest first, without the parent message
+    replies = []
+    for replies_resp in paged_query(replies_url(token, channel, thread_ts),
+                                    client):
+        if not replies_resp['ok']:
+            raise ValueError("Error fetching thread replies from Slack: ",
+                             replies_resp["error"])
+        for message in replies_resp['messages']:
+            if message.get('ts') != thread_ts:
+                replies.append(message)
+    return replies
+
+
+def is_thread_parent(msg):
+    return (isinstance(msg, dict) and bool(msg.get('reply_count')) and
+            msg.get('thread_ts') == msg.get('ts'))
+
+
+def thread_messages(msg, replies, seen):
+    # A message followed by its replies, skipping replies that were already
+    # in the stream, e.g. ones also sent to the channel.
+    ts = msg.get('ts') if isinstance(msg, dict) else None
+    if ts is not None and msg.get('thread_ts', ts) != ts:
+        if ts in seen:
+            return []
+        seen.add(ts)
+    items = [msg]
+    for reply in replies or ():
+        if reply.get('ts') not in seen:
+            seen.add(reply.get('ts'))
+            items.append(reply)
+    return items
+
+
+def with_thread_replies(messages, token, channel, client=None,
+                        workers=DEFAULT_REPLY_WORKERS,
+                        window=DEFAULT_REPLY_WINDOW):
+    # Interleaves the replies of every thread right after its parent. The
+    # replies are fetched on a pool of `workers` threads while at most
+    # `window` messages wait for them, so the channel is never held in
+    # memory as a whole.
+    fetched = set()
+
+    def wanted(msg):
+        if is_thread_parent(msg) and msg['ts'] not in fetched:
+            fetched.add(msg['ts'])
+            return True
+        return False
+
+    seen = set()
+    pool = ThreadPool(workers)
+    try:
+        for msg, replies in ordered_imap(
+                lambda parent: fetch_replies(token, channel, parent['ts'],
+                                             client),
+                messages, pool, window, wanted):
+            for item in thread_messages(msg, replies, seen):
+                yield item
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def filter_messages(messages, text, keep=None):
+    if keep is None:
+        keep = compile_filter(text)
+    for msg in messages:
+        if keep(msg):
+            msg.pop('subtype', None)
+            yield msg
+
+
+class MessageWriter(object):
+    # The per-message end of exporting one conversation, shared by both
+    # engines: skips what a checkpoint already has, filters, adds the
+    # channel column and enrich fields, writes, and records the counts in
+    # metrics when done.
+
+    def __init__(self, writer, conversation_id, keep, channel_column=False,
+                 enrich=None, checkpoint=None, metrics=None):
+        self.writer = writer
+        self.conversation_id = conversation_id
+        self.keep = keep
+        # writers keyed by channel, e.g. SQLite, always get the channel
+        self.channel_column = (channel_column or
+                               getattr(writer, 'needs_channel', False))
+        self.enrich = enrich
+        self.checkpoint = checkpoint
+        self.metrics = metrics
+        self.count = 0
+        self.filtered = 0
+        self.skipped = 0
+        self.write_seconds = 0.0
+
+    def wanted(self, msg):
+        # whether msg will be written
+        return self.keep(msg) and (self.checkpoint is None or
+                                   self.checkpoint.is_new(msg))
+
+    def write(self, msg):
+        if isinstance(msg, PageDone):
+            if self.checkpoint is not None:
+                self.writer.flush()
+                self.checkpoint.page_done(msg.next_cursor, msg.newest)
+            return
+        if self.checkpoint is not None and not self.checkpoint.is_new(msg):
+            self.skipped += 1
+            return
+        if not self.keep(msg):
+            self.filtered += 1
+            return
+        msg.pop('subtype', None)
+        if self.channel_column:
+            msg['channel'] = self.conversation_id
+        if self.enrich is not None:
+            self.enrich(msg)
+        if self.metrics is None:
+            self.writer.write(msg)
+        else:
+            start = time.time()
+            self.writer.write(msg)
+            self.write_seconds += time.time() - start
+        self.count += 1
+
+    def close(self):
+        # returns the number of messages written
+        if self.metrics is not None:
+            self.metrics.add('rows_written', self.count)
+            self.metrics.add('rows_filtered', self.filtered)
+            self.metrics.add('rows_skipped', self.skipped)
+            self.metrics.add('write_seconds', self.write_seconds)
+        return self.count
+
+
+def export_conversation(token, conversation_id, oldest, writer, text='',
+                        client=None, channel_column=False, quiet=False,
+                        state=None, slices=1, keep=None, search=False,
+                        threads=False, fields=None, enrich=None,
+                        prefetch_pages=DEFAULT_PREFETCH_PAGES, files=None):
+    # Fetching runs up to prefetch_pages pages ahead of filtering and
+    # writing on a separate thread, so that the network and the disk are
+    # busy at the same time; 0 runs both in lockstep. Given a
+    # files.FileStore, the files of written messages are downloaded too.
+    checkpoint = None
+    if keep is None:
+        keep = compile_filter(text)
+    if search and text:
+        messages = fetch_from_search(token, conversation_id, oldest, text,
+                                     client)
+    elif state is None and slices > 1:
+        messages = fetch_from_slack_sliced(token, conversation_id, oldest,
+                                           slices, client, quiet=quiet,
+                                           fields=fields)
+    elif state is None:
+        # page markers let the prefetch thread hand over whole pages
+        messages = fetch_from_slack(token, conversation_id, oldest, client,
+                                    quiet=quiet, fields=fields,
+                                    page_markers=prefetch_pages > 0)
+    else:
+        # incremental export: skip what earlier runs wrote and save
+        # progress after every page, once its rows are on disk
+        checkpoint = state.checkpoint(conversation_id, oldest)
+        messages = fetch_from_slack(token, conversation_id, checkpoint.oldest,
+                                    client, quiet=quiet,
+                                    cursor=checkpoint.cursor,
+                                    page_markers=True, fields=fields)
+    if threads:
+        messages = with_thread_replies(messages, token, conversation_id,
+                                       client)
+    if fields is not None and (search or threads):
+        # search results and replies are not projected while fetched
+        messages = (msg if isinstance(msg, PageDone) else project(msg, fields)
+                    for msg in messages)
+    sink = MessageWriter(writer, conversation_id, keep, channel_column,
+                         enrich, checkpoint, getattr(client, 'metrics', None))
+    if files is not None:
+        messages = with_files(messages, files, sink.wanted)
+    if prefetch_pages > 0:
+        messages = prefetch(messages, prefetch_pages,
+                            lambda msg: isinstance(msg, PageDone))
+    for msg in messages:
+        sink.write(msg)
+    return sink.close()
+
+
+def export_conversations(token, conversations, oldest, filename, text='',
+                         client=None, workers=DEFAULT_WORKERS, state=None,
+                         slices=1, open_writer=open_csv_writer, keep=None,
+                         search=False, threads=False, fields=None,
+                         enrich=None, prefetch_pages=DEFAULT_PREFETCH_PAGES,
+                         files=None):
+    # Exports several conversations concurrently. A "{channel}" placeholder
+    # in filename writes one CSV per conversation, otherwise everything goes
+    # into one CSV with an extra channel column.
+    per_channel = CHANNEL_PLACEHOLDER in filename
+    append = state is not None
+    merged = None
+    if not per_channel:
+        merged = open_writer(filename, append)
+
+    def export(channel):
+        name = conversation_name(channel) or channel["id"]
+        writer = merged
+        try:
+            if per_channel:
+                writer = open_writer(
+                    filename.replace(CHANNEL_PLACEHOLDER, name), append)
+            try:
+                count = export_conversation(token, channel["id"], oldest,
+                                            writer, text, client,
+                                            channel_column=not per_channel,
+                                            quiet=True, state=state,
+                                            slices=slices, keep=keep,
+                                            search=search, threads=threads,
+                                            fields=fields, enrich=enrich,
+                                            prefetch_pages=prefetch_pages,
+                                            files=files)
+            finally:
+                if per_channel:
+                    writer.close()
+            return name, count, None
+        except Exception as e:
+            return name, 0, e
+
+    ok = True
+    pool = ThreadPool(workers)
+    try:
+        for name, count, error in pool.imap_unordered(export, conversations):
+            if error is not None:
+                ok = False
+                print("Error exporting", name, ":", error)
+            else:
+                print("Exported {0} messages from {1}".format(count, name))
+    finally:
+        pool.close()
+        pool.join()
+        if merged is not None:
+            merged.close()
+    return ok
+
+
+def write_metrics(metrics, json_path=None, prometheus_path=None):
+    if metrics is None:
+        return
+    if json_path:
+        metrics.write_json(json_path)
+    if prometheus_path:
+        metrics.write_prometheus(prometheus_path)
+
+
+def run(args):
+    # Runs an export for arguments parsed by cli.parse_args()
+    from .archive import ArchiveClient, PageArchive
+    from .directory import Directory
+    from .fixtures import RecordingClient, ReplayClient
+
+    columns = None
+    fields = None
+    if args.columns:
+        columns = [c.strip() for c in args.columns.split(',') if c.strip()]
+        if args.files_dir and FILE_PATHS_COLUMN not in columns:
+            columns.append(FILE_PATHS_COLUMN)
+        # only keep what the columns need of every message
+        fields = message_fields(columns)
+        if args.files_dir:
+            fields = fields.union(['files'])
+    open_output = functools.partial(open_writer, format=args.format,
+                                    columns=columns, schema=args.schema,
+                                    compress=args.compress,
+                                    buffer_size=args.buffer_size)
+    if args.partition:
+        # Parquet files can not be appended to, nor can union CSVs gain
+        # columns, so those keep every partition open until the end
+        bounded = args.format != 'parquet' and args.schema != 'union'
+        open_output = functools.partial(
+            open_partitioned_writer, partition=args.partition,
+            open_writer=open_output,
+            max_open=DEFAULT_OPEN_PARTITIONS if bounded else None)
+
+    metrics = None
+    if args.metrics_json or args.metrics_prom:
+        metrics = Metrics()
+    archive = None
+    if args.archive_dir:
+        archive = PageArchive(args.archive_dir)
+    if args.from_archive:
+        client = ArchiveClient(PageArchive(args.from_archive),
+                               metrics=metrics)
+    elif args.replay_fixture:
+        client = ReplayClient(args.replay_fixture, args.replay_latency,
+                              metrics)
+    else:
+        client = SlackClient(pool_size=args.pool_size,
+                             timeout=args.request_timeout,
+                             retries=args.retries, pace=PACE_REQUESTS,
+                             metrics=metrics, json_loads=fast_loads(),
+                             archive=archive)
+    if args.record_fixture:
+        client = RecordingClient(client, args.record_fixture)
+
+    files = None
+    if args.files_dir:
+        files = FileStore(args.files_dir, args.token, args.file_workers,
+                          args.request_timeout, args.retries, metrics)
+
+    time_diff = time.mktime((datetime.now() -
+                             timedelta(days=int(args.past_days))).timetuple())
+
+    state = None
+    if args.state_file:
+        state = ExportState(args.state_file)
+
+    directory = Directory(args.token, client, cache_dir=args.cache_dir or None,
+                          ttl=args.directory_ttl * 60 * 60,
+                          refresh=args.refresh_directory)
+
+    conversations = None
+    if args.channels:
+        # the name indexes --users and --enrich need are walked on their
+        # own threads while the conversations to export are listed
+        directory.prefetch(
+            users=bool(args.users or args.enrich),
+            channel_types="public_channel,private_channel"
+            if args.enrich else None)
+        exported_until = None
+        if args.skip_unchanged:
+            if state is not None:
+                exported_until = functools.partial(state.exported_until,
+                                                   oldest=time_diff)
+            else:
+                exported_until = lambda conversation_id: time_diff
+        conversations = list(select_conversations(
+            args.token, args.channels, args.types, client,
+            args.exclude_archived, args.min_members, exported_until))
+        if not conversations:
+            if args.skip_unchanged:
+                print(args.channels, " matched no Slack channels updated since the last export")
+                client.close()
+                write_metrics(metrics, args.metrics_json, args.metrics_prom)
+                return True
+            print(args.channels, " matched no Slack channels. Exiting...")
+            return False
+
+    users = None
+    if args.users:
+        users = []
+        for name in args.users.split(','):
+            id = name.strip()
+            if id and not id.startswith("U"):
+                id = directory.user_id(id)
+                if id == "":
+                    print(name, " was not found in the Slack user list. Exiting...")
+                    return False
+            if id:
+                users.append(id)
+    keep = compile_filter(args.text, args.match, users,
+                          args.exclude_subtypes.split(','))
+    enrich = None
+    if args.enrich:
+        # one users.list and conversations.list walk, shared by every
+        # conversation of the run
+        enrich = compile_enrich(
+            directory.user_names(),
+            directory.channel_names("public_channel,private_channel"))
+
+    if conversations is not None:
+        if args.engine == 'asyncio':
+            from . import aio
+            ok, summary = aio.export_conversations_sync(
+                args.token, conversations, time_diff, args.filename,
+                args.text, args.workers, state, open_output, keep, fields,
+                enrich, pool_size=args.pool_size,
+                timeout=args.request_timeout, retries=args.retries,
+                limiter=client.limiter, metrics=metrics,
+                json_loads=client.json_loads, archive=archive)
+        else:
+            ok = export_conversations(args.token, conversations, time_diff,
+                                      args.filename, args.text, client,
+                                      args.workers, state, args.slices,
+                                      open_output, keep, args.search,
+                                      args.threads, fields, enrich,
+                                      args.prefetch, files)
+            summary = client.summary()
+        print(summary)
+        client.close()
+        if files is not None:
+            files.close()
+        write_metrics(metrics, args.metrics_json, args.metrics_prom)
+        return ok
 
     channel_id = args.channel
     user_id = args.user
@@ -111,7 +852,7 @@ def main():
     if user_id:
         types = "im"
         if not user_id.startswith("U"):
-            id = lookup_user_id_by_name(args.token, args.user)
+            id = directory.user_id(args.user)
             if id == "":
                 print(user_id, " was not found in the Slack user list. Exiting...")
                 return False
@@ -122,7 +863,7 @@ def main():
     # Check if this is an id or a name
     if channel_id:
         if not channel_id.startswith("C"):
-            id = lookup_channel_id_by_name(args.token, channel_id, types)
+            id = directory.channel_id(channel_id, types)
             if id == "":
                 print(channel_id, " was not found in the Slack channel list. Exiting...")
                 return False
@@ -134,54 +875,20 @@ def main():
         print("Could not find a valid conversation id. Exiting...")
         return False
 
-    time_diff = time.mktime((datetime.now() -
-                             timedelta(days=int(args.past_days))).timetuple())
-
-    # open a file for writing
-
-    csv_file = open(args.filename, 'w')
-
-    # create the csv writer object
-
-    csvwriter = csv.writer(csv_file)
-
-    count = 0
-    last_timestamp = 0
-    header = []
-
-    for msg in fetch_from_slack(args.token, conversation_id, time_diff):
-
-        try:
-            msgText = msg.get('text')
-        except:
-            raise
-
-        if msg.get('subtype') != 'bot_message':
-            msgUser = msg.get('user')
-
-            if 'subtype' in msg:
-                del msg['subtype']
-
-            if msgUser != None and msgText.find(args.text) == 0:
-
-                # Write the header if first row
-                if count == 0:
-                    header = sorted(msg.keys())
-
-                    csvwriter.writerow(header)
-
-                    count += 1
-
-                last_timestamp = datetime.fromtimestamp(
-                    float(msg.get('ts')))
-
-                # write the csv row
-                row = [msg.get(k) for k in header]
-                csvwriter.writerow(row)
-
-    csv_file.close()
-
-
-if __name__ == "__main__":
-    # execute only if run as a script
-    main()
+    writer = open_output(args.filename, append=state is not None)
+    export_conversation(args.token, conversation_id, time_diff, writer,
+                        args.text, client, state=state, slices=args.slices,
+                        keep=keep, search=args.search, threads=args.threads,
+                        fields=fields, enrich=enrich,
+                        prefetch_pages=args.prefetch, files=files)
+    writer.close()
+    print(client.summary())
+    client.close()
+    if files is not None:
+        files.close()
+    write_metrics(metrics, args.metrics_json, args.metrics_prom)
+
+
+def main(argv=None):
+    from .cli import main
+    return main(argv)
@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+
+
+class ExportState(object):
+    # Per-conversation progress of incremental exports, kept in a JSON file:
+    # the newest exported message ts and, while a walk is in progress, the
+    # oldest it started from and the next cursor to fetch. Safe to share
+    # between export threads.
+
+    def __init__(self, path):
+        self.path = path
+        self.conversations = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.conversations = json.load(f).get('conversations', {})
+
+    def get(self, conversation_id):
+        with self.lock:
+            return dict(self.conversations.get(conversation_id, {}))
+
+    def exported_until(self, conversation_id, oldest=None):
+        # where the next walk of a conversation starts: after the newest
+        # message a finished walk exported, else at oldest; None while a
+        # walk is in progress
+        saved = self.get(conversation_id)
+        if saved.get('cursor'):
+            return None
+        return saved.get('ts') or oldest
+
+    def update(self, conversation_id, ts, cursor=None, oldest=None):
+        with self.lock:
+            self.conversations[conversation_id] = {
+                'ts': ts,
+                'cursor': cursor or None,
+                'oldest': oldest if cursor else None,
+            }
+            self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'conversations': self.conversations}, f, indent=2,
+                      sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def checkpoint(self, conversation_id, oldest):
+        return Checkpoint(self, conversation_id, oldest)
+
+
+class Checkpoint(object):
+    # Where one conversation's export starts, and what it has done so far.
+    # An interrupted walk resumes from its saved cursor, a finished one
+    # continues from its newest exported message.
+
+    def __init__(self, state, conversation_id, oldest):
+        self.state = state
+        self.conversation_id = conversation_id
+        saved = state.get(conversation_id)
+        self.ts = saved.get('ts')
+        self.cursor = saved.get('cursor')
+        if self.cursor:
+            self.oldest = saved['oldest']
+        elif self.ts:
+            self.oldest = float(self.ts)
+        else:
+            self.oldest = oldest
+        self.last_ts = float(self.ts) if self.ts else None
+        self.newest = self.ts
+
+    def is_new(self, msg):
+        ts = msg.get('ts')
+        return (ts is None or self.last_ts is None or
+                float(ts) > self.last_ts)
+
+    def page_done(self, next_cursor, newest=None):
+        if newest is not None and (self.newest is None or
+                                   float(newest) > float(self.newest)):
+            self.newest = newest
+        self.state.update(self.conversation_id, self.newest, next_cursor,
+                          self.oldest)
@@ -0,0 +1,6 @@
+import sys
+
+# the asyncio engine and its tests are Python 3.6+ syntax
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append("test_aio.py")
@@ -0,0 +1,233 @@
+# A small in-process fake of the Slack Web API, serving synthetic
+# conversations.history, conversations.replies, conversations.list and
+# users.list pages, and the files shared in messages, over real HTTP on
+# localhost.
+import json
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients that time out hang up before their answer is sent
+        pass
+
+
+class FakeSlack(object):
+    # channels maps channel id to the number of messages in it. Messages
+    # are one second apart starting at `start`, and every `thread_every`-th
+    # one starts a thread of `replies` replies. Channels in `archived` are
+    # archived. Every `files_every`-th message shares a file, the same one in
+    # every channel; files in `missing_files` are answered with a 404.
+    # Every `rate_limit_every`-th API request is answered with a 429.
+
+    def __init__(self, channels=None, users=10, page_size=100, latency=0.0,
+                 rate_limit_every=0, retry_after=0, start=1500000000,
+                 thread_every=0, replies=0, archived=(), files_every=0,
+                 missing_files=()):
+        self.channels = channels if channels is not None else {"C1": 10}
+        self.users = users
+        self.page_size = page_size
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.start = start
+        self.thread_every = thread_every
+        self.replies = replies
+        self.archived = set(archived)
+        self.files_every = files_every
+        self.missing_files = set(missing_files)
+        self.requests = 0
+        self.rate_limited = 0
+        # (method, params) of every request, in the order they came in
+        self.log = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{0}/api/".format(self.server.server_port)
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def message(self, channel, i):
+        msg = {
+            "type": "message",
+            "user": "U{0:07d}".format(i % self.users),
+            "text": "message {0} in {1}".format(i, channel),
+            "ts": "{0}.000100".format(self.start + i),
+        }
+        if self.is_thread(i):
+            msg["thread_ts"] = msg["ts"]
+            msg["reply_count"] = self.replies
+        if self.files_every and i % self.files_every == 0:
+            msg["files"] = [self.file(i)]
+        return msg
+
+    def file(self, i):
+        id = "F{0:07d}".format(i)
+        return {
+            "id": id,
+            "name": "notes {0}.txt".format(i),
+            "mimetype": "text/plain",
+            "url_private": self.url.replace(
+                "/api/", "/files/{0}/notes.txt".format(id)),
+        }
+
+    def file_content(self, id):
+        return "contents of {0}\n".format(id).encode("utf-8")
+
+    def is_thread(self, i):
+        return bool(self.thread_every and self.replies and
+                    i % self.thread_every == 0)
+
+    def reply(self, channel, i, j):
+        return {
+            "type": "message",
+            "user": "U{0:07d}".format(j % self.users),
+            "text": "reply {0} to {1} in {2}".format(j, i, channel),
+            "ts": "{0}.{1:06d}".format(self.start + i, 200 + j),
+            "thread_ts": "{0}.000100".format(self.start + i),
+        }
+
+    def history(self, params):
+        channel = params.get("channel")
+        if channel not in self.channels:
+            return {"ok": False, "error": "channel_not_found"}
+        oldest = float(params.get("oldest", 0))
+        latest = float(params.get("latest", float("inf")))
+        indexes = [i for i in range(self.channels[channel])
+                   if oldest <= self.start + i + 0.0001 <= latest]
+        page, next_cursor = self.page(indexes, params)
+        messages = [self.message(channel, i) for i in page]
+        # pages run oldest to newest, messages in a page newest to oldest
+        messages.reverse()
+        return self.paged({"ok": True, "messages": messages}, next_cursor)
+
+    def page(self, items, params):
+        offset = int(params.get("cursor", 0) or 0)
+        items = list(items)
+        page = items[offset:offset + self.page_size]
+        next_cursor = ""
+        if offset + self.page_size < len(items):
+            next_cursor = str(offset + self.page_size)
+        return page, next_cursor
+
+    def paged(self, resp, next_cursor):
+        resp["response_metadata"] = {"next_cursor": next_cursor}
+        return resp
+
+    def conversations_replies(self, params):
+        channel = params.get("channel")
+        if channel not in self.channels:
+            return {"ok": False, "error": "channel_not_found"}
+        i = int(float(params.get("ts", 0))) - self.start
+        if not 0 <= i < self.channels[channel] or not self.is_thread(i):
+            return {"ok": False, "error": "thread_not_found"}
+        # the parent comes first on every page, then replies oldest first
+        page, next_cursor = self.page(range(self.replies), params)
+        messages = [self.message(channel, i)]
+        messages.extend(self.reply(channel, i, j) for j in page)
+        return self.paged({"ok": True, "messages": messages}, next_cursor)
+
+    def users_list(self, params):
+        page, next_cursor = self.page(range(self.users), params)
+        members = [{"id": "U{0:07d}".format(i), "name": "user{0}".format(i)}
+                   for i in page]
+        return self.paged({"ok": True, "members": members}, next_cursor)
+
+    def conversations_list(self, params):
+        ids = sorted(self.channels)
+        if params.get("exclude_archived") == "true":
+            ids = [c for c in ids if c not in self.archived]
+        page, next_cursor = self.page(ids, params)
+        # one member per message, updated (in milliseconds) when the newest
+        # message was posted
+        channels = [{"id": c, "name": "channel-" + c.lower(),
+                     "is_archived": c in self.archived,
+                     "num_members": self.channels[c],
+                     "updated": (self.start +
+                                 max(self.channels[c] - 1, 0)) * 1000}
+                    for c in page]
+        return self.paged({"ok": True, "channels": channels}, next_cursor)
+
+    def handle(self, request):
+        url = urlparse(request.path)
+        method = url.path.rsplit("/", 1)[-1]
+        params = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        if url.path.startswith("/files/"):
+            id = url.path.split("/")[2]
+            with self.lock:
+                self.log.append(("files", {
+                    "id": id,
+                    "authorization": request.headers.get("Authorization")}))
+            if id in self.missing_files:
+                return self.send(request, b"Not Found", "text/plain", 404)
+            return self.send(request, self.file_content(id), "text/plain")
+        with self.lock:
+            self.requests += 1
+            self.log.append((method, params))
+            limited = (self.rate_limit_every and
+                       self.requests % self.rate_limit_every == 0)
+            if limited:
+                self.rate_limited += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if limited:
+            request.send_response(429)
+            request.send_header("Retry-After", str(self.retry_after))
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+
+        handler = {
+            "conversations.history": self.history,
+            "conversations.list": self.conversations_list,
+            "conversations.replies": self.conversations_replies,
+            "users.list": self.users_list,
+        }.get(method)
+        if handler is None:
+            resp = {"ok": False, "error": "unknown_method"}
+        else:
+            resp = handler(params)
+
+        self.send(request, json.dumps(resp).encode("utf-8"),
+                  "application/json")
+
+    def send(self, request, body, content_type, status=200):
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
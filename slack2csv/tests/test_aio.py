@@ -0,0 +1,92 @@
+# Standard library imports...
+import asyncio
+import pytest
+
+# Local imports...
+from slack2csv.tests.fake_slack import FakeSlack
+
+aiohttp = pytest.importorskip("aiohttp")
+aio = pytest.importorskip("slack2csv.aio")
+
+
+async def collect(token, channel, oldest, client):
+    return [m async for m in aio.fetch_from_slack(token, channel, oldest,
+                                                   client)]
+
+
+def test_fetch_from_slack_paged(monkeypatch):
+    with FakeSlack(channels={"C1": 250}, page_size=100) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        async def fetch():
+            async with aio.AsyncSlackClient(pace=False) as client:
+                return await collect('a', 'C1', '1', client), client.requests
+
+        messages, requests = aio.run(fetch())
+
+    assert(len(messages) == 250)
+    assert(requests == 3)
+    # same oldest to newest order as the blocking fetch_from_slack
+    assert([m["ts"] for m in messages] ==
+           sorted(m["ts"] for m in messages))
+
+
+def test_fetch_from_slack_error(monkeypatch):
+    with FakeSlack() as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        async def fetch():
+            async with aio.AsyncSlackClient(pace=False) as client:
+                return await collect('a', 'C404', '1', client)
+
+        with pytest.raises(ValueError) as exc_info:
+            aio.run(fetch())
+
+    assert "channel_not_found" in str(exc_info.value)
+
+
+def test_client_retries_after_429(monkeypatch):
+    with FakeSlack(channels={"C1": 30}, page_size=10,
+                   rate_limit_every=2) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        async def fetch():
+            async with aio.AsyncSlackClient(pace=False) as client:
+                return await collect('a', 'C1', '1', client)
+
+        messages = aio.run(fetch())
+
+        assert(len(messages) == 30)
+        assert(slack.rate_limited == 2)
+
+
+def test_client_retries_timeouts(monkeypatch):
+    monkeypatch.setattr("slack2csv.aio.RETRY_BACKOFF_FACTOR", 0.01)
+    with FakeSlack(latency=0.2) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        client = aio.AsyncSlackClient(pace=False, timeout=0.05, retries=1)
+
+        async def fetch():
+            async with client:
+                return await collect('a', 'C1', '1', client)
+
+        # timed out requests are retried like connection errors
+        with pytest.raises(asyncio.TimeoutError):
+            aio.run(fetch())
+        assert(client.requests == 2)
+
+
+def test_export_conversations_sync(monkeypatch, tmpdir):
+    channels = [{"id": "C1", "name": "one"}, {"id": "C2", "name": "two"}]
+    with FakeSlack(channels={"C1": 120, "C2": 5}, page_size=50) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+        filename = str(tmpdir.join("{channel}.csv"))
+
+        ok, summary = aio.export_conversations_sync(
+            'a', channels, '1', filename, workers=2, pace=False)
+
+    assert(ok)
+    assert("4 requests" in summary)
+    assert(len(tmpdir.join("one.csv").readlines()) == 121)
+    assert(len(tmpdir.join("two.csv").readlines()) == 6)
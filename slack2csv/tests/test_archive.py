@@ -0,0 +1,75 @@
+# Standard library imports...
+import os
+import pytest
+
+# Local imports...
+from slack2csv.archive import ArchiveClient, PageArchive
+from slack2csv.slack2csv import (SlackClient, export_conversation,
+                                 fetch_from_slack, list_users)
+from slack2csv.tests.fake_slack import FakeSlack
+from slack2csv.writers import open_csv_writer
+
+
+def export(client, filename, text='', threads=False, oldest='1'):
+    writer = open_csv_writer(filename)
+    try:
+        return export_conversation('a', 'C1', oldest, writer, text, client,
+                                   quiet=True, threads=threads)
+    finally:
+        writer.close()
+
+
+def count_files(path):
+    return sum(len(files) for _, _, files in os.walk(path))
+
+
+def test_archive_replays_export(monkeypatch, tmpdir):
+    archive_dir = str(tmpdir.join("archive"))
+    live = str(tmpdir.join("live.csv"))
+    replayed = str(tmpdir.join("replayed.csv"))
+
+    with FakeSlack(channels={"C1": 30}, page_size=7, thread_every=10,
+                   replies=3) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+        client = SlackClient(pace=False, archive=PageArchive(archive_dir))
+        assert(export(client, live, threads=True) == 30 + 3 * 3)
+        list(list_users('a', client))
+        pages = count_files(archive_dir)
+
+        # the same pages again are not stored twice
+        export(client, live, threads=True)
+        assert(count_files(archive_dir) == pages)
+
+    replay = ArchiveClient(PageArchive(archive_dir), page_size=4)
+    assert(export(replay, replayed, threads=True) == 30 + 3 * 3)
+    assert(open(replayed).read() == open(live).read())
+    assert(len(list(list_users('a', replay))) == 10)
+
+    # another report from the same pages, without the network
+    assert(export(replay, replayed, text='message 1') == 11)
+    assert(export(replay, replayed, oldest='1500000025') == 5)
+
+
+def test_archive_merges_runs(monkeypatch, tmpdir):
+    archive = PageArchive(str(tmpdir.join("archive")))
+
+    with FakeSlack(channels={"C1": 10}, page_size=4) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+        client = SlackClient(pace=False, archive=archive)
+        list(fetch_from_slack('a', 'C1', 1, client, quiet=True))
+        slack.channels["C1"] = 15
+        list(fetch_from_slack('a', 'C1', 1500000008, client, quiet=True))
+
+    messages = list(fetch_from_slack('a', 'C1', 1, ArchiveClient(archive),
+                                     quiet=True))
+    assert([m["ts"] for m in messages] ==
+           ["{0}.000100".format(1500000000 + i) for i in range(15)])
+
+
+def test_archive_missing_conversation(tmpdir):
+    replay = ArchiveClient(PageArchive(str(tmpdir)))
+
+    with pytest.raises(ValueError) as exc_info:
+        list(fetch_from_slack('a', 'C1', 1, replay, quiet=True))
+
+    assert "not_in_archive" in str(exc_info.value)
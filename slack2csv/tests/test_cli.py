@@ -0,0 +1,72 @@
+# Standard library imports...
+import os
+import subprocess
+import sys
+import pytest
+
+# Local imports...
+from slack2csv.cli import parse_args
+from slack2csv.defaults import FORMATS, PARTITIONS
+from slack2csv.writers import PERIOD_FORMATS, WRITERS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+def test_parse_args_defaults():
+    args = parse_args(['--token', 'a', '--filename', 'out.csv',
+                       '--channel', 'general'])
+
+    assert(args.format == 'csv')
+    assert(args.past_days == '1')
+    assert(args.workers == 4)
+
+
+def test_parse_args_validation(capsys):
+    with pytest.raises(SystemExit):
+        parse_args(['--token', 'a', '--filename', 'out.csv', '--channel',
+                    'general', '--slices', '4', '--state_file', 's.json'])
+
+    assert("--slices can not be combined with --state_file" in
+           capsys.readouterr().err)
+
+    # a single conversation is always exported on the calling thread
+    with pytest.raises(SystemExit):
+        parse_args(['--token', 'a', '--filename', 'out.csv', '--channel',
+                    'general', '--engine', 'asyncio'])
+    assert("--engine asyncio needs --channels" in capsys.readouterr().err)
+
+    # before any request goes out
+    with pytest.raises(SystemExit):
+        parse_args(['--token', 'a', '--filename', 'out.csv', '--channel',
+                    'general', '--match', 'regex', '--text', '('])
+    assert("--text is not a valid --match regex" in capsys.readouterr().err)
+
+
+def test_formats_match_writers():
+    assert(sorted(FORMATS) == sorted(WRITERS))
+    assert(sorted(PARTITIONS) == sorted(PERIOD_FORMATS))
+
+
+def test_parse_args_partition(capsys):
+    args = parse_args(['--token', 'a', '--filename', '{period}.csv',
+                       '--channel', 'general', '--partition', 'day'])
+    assert(args.partition == 'day')
+
+    for argv in (['--filename', 'out.csv', '--partition', 'day'],
+                 ['--filename', '{period}.csv']):
+        with pytest.raises(SystemExit):
+            parse_args(['--token', 'a', '--channel', 'general'] + argv)
+        assert("--partition needs {period}" in capsys.readouterr().err)
+
+
+def test_cli_does_not_import_http_client():
+    # --help and usage errors must not pay for requests and friends
+    out = subprocess.check_output(
+        [sys.executable, '-c',
+         'import sys, slack2csv, slack2csv.cli; '
+         'print(sorted(m for m in ("requests", "urllib3", "progress", '
+         '"slack2csv.slack2csv") if m in sys.modules))'],
+        env=dict(os.environ, PYTHONPATH=ROOT))
+
+    assert(out.decode('utf-8').strip() == '[]')
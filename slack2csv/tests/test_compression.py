@@ -0,0 +1,81 @@
+# Standard library imports...
+import gzip
+import pytest
+
+# Local imports...
+from slack2csv.compression import infer_compression, open_input_file, open_output_file
+from slack2csv.writers import open_writer
+
+MESSAGE = {
+    "type": "message",
+    "user": "U0012345",
+    "text": "Hey!",
+    "ts": "1513173325.000024",
+}
+
+
+def test_infer_compression():
+    assert(infer_compression("out.csv.gz") == "gzip")
+    assert(infer_compression("out.jsonl.zst") == "zstd")
+    assert(infer_compression("out.csv") == "none")
+    assert(infer_compression("out.csv", "gzip") == "gzip")
+    assert(infer_compression("out.csv.gz", "none") == "none")
+
+
+def test_gzip_output(tmpdir):
+    filename = str(tmpdir.join("out.csv.gz"))
+
+    writer = open_writer(filename)
+    writer.write(dict(MESSAGE))
+    writer.close()
+
+    assert(gzip.open(filename, 'rt').read().splitlines() == [
+        "text,ts,type,user", "Hey!,1513173325.000024,message,U0012345"])
+
+
+@pytest.mark.parametrize("extension", [".gz", ".zst"])
+def test_compressed_append(tmpdir, extension):
+    if extension == ".zst":
+        pytest.importorskip("zstandard")
+    filename = str(tmpdir.join("out.csv" + extension))
+
+    for ts in ["1", "2"]:
+        writer = open_writer(filename, append=True, buffer_size=16)
+        writer.write(dict(MESSAGE, ts=ts))
+        writer.close()
+
+    with open_input_file(filename) as f:
+        assert(f.read().splitlines() == [
+            "text,ts,type,user",
+            "Hey!,1,message,U0012345",
+            "Hey!,2,message,U0012345"])
+
+
+@pytest.mark.parametrize("compress", ["gzip", "zstd"])
+def test_flush_reaches_disk(tmpdir, compress):
+    if compress == "zstd":
+        pytest.importorskip("zstandard")
+    filename = str(tmpdir.join("out.jsonl"))
+
+    f = open_output_file(filename, compress=compress)
+    f.write(u"first line\n")
+    f.flush()
+
+    # everything flushed so far can be decompressed while still open
+    with open_input_file(filename, compress) as reader:
+        assert(reader.readline() == "first line\n")
+    f.close()
+
+
+@pytest.mark.parametrize("extension", ["", ".gz"])
+def test_python2_files_take_bytes(monkeypatch, tmpdir, extension):
+    # what the Python 2 csv module writes and reads
+    monkeypatch.setattr("slack2csv.compression.PY2", True)
+    filename = str(tmpdir.join("out.csv" + extension))
+
+    f = open_output_file(filename)
+    f.write(b"text,ts\r\ncaf\xc3\xa9,1\r\n")
+    f.close()
+
+    with open_input_file(filename) as reader:
+        assert(reader.read() == b"text,ts\r\ncaf\xc3\xa9,1\r\n")
@@ -0,0 +1,128 @@
+# Standard library imports...
+import os
+from mock import Mock, patch
+
+# Local imports...
+import slack2csv.slack2csv
+from slack2csv.directory import Directory
+
+slack2csv.slack2csv.PACE_REQUESTS = False
+
+
+def fake_directory(url, timeout=None):
+    true = 1
+    response = Mock(status_code=200)
+    if "users.list" in url:
+        response.json.return_value = {
+            "ok": true,
+            "members": [
+                {"id": "U5NQQHZ11", "name": "alice"},
+                {"id": "U5NQQHZ12", "name": "jane"},
+            ]
+        }
+    else:
+        response.json.return_value = {
+            "ok": true,
+            "channels": [
+                {"id": "C8675309", "name": "jenny"},
+                {"id": "D0000001", "user": "U5NQQHZ11"},
+            ]
+        }
+    return response
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_directory_scans_once_per_run(mock_get):
+    mock_get.side_effect = fake_directory
+
+    directory = Directory('a', cache_dir=None)
+
+    assert(directory.user_id('alice') == "U5NQQHZ11")
+    assert(directory.user_id('jane') == "U5NQQHZ12")
+    assert(directory.user_id('bob') == "")
+    assert(directory.channel_id('jenny') == "C8675309")
+    assert(directory.channel_id('U5NQQHZ11') == "D0000001")
+    assert(mock_get.call_count == 2)
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_directory_cached_on_disk(mock_get, tmpdir):
+    mock_get.side_effect = fake_directory
+
+    token = 'xoxb-secret'
+    assert(Directory(token, cache_dir=str(tmpdir)).user_id('alice') ==
+           "U5NQQHZ11")
+    assert(Directory(token, cache_dir=str(tmpdir)).user_id('alice') ==
+           "U5NQQHZ11")
+    assert(mock_get.call_count == 1)
+
+    # the token is not written to the cache
+    for name in os.listdir(str(tmpdir)):
+        assert(token not in name)
+        assert(token not in tmpdir.join(name).read())
+
+    # other workspaces get their own cache
+    Directory('xoxb-other', cache_dir=str(tmpdir)).user_id('alice')
+    assert(mock_get.call_count == 2)
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_directory_ttl_and_refresh(mock_get, tmpdir):
+    mock_get.side_effect = fake_directory
+
+    Directory('a', cache_dir=str(tmpdir)).channel_id('jenny')
+    Directory('a', cache_dir=str(tmpdir), refresh=True).channel_id('jenny')
+    assert(mock_get.call_count == 2)
+
+    Directory('a', cache_dir=str(tmpdir), ttl=-1).channel_id('jenny')
+    assert(mock_get.call_count == 3)
+
+    Directory('a', cache_dir=str(tmpdir)).channel_id('jenny')
+    assert(mock_get.call_count == 3)
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_directory_cache_miss_rebuilds_once(mock_get, tmpdir):
+    mock_get.side_effect = fake_directory
+
+    directory = Directory('a', cache_dir=str(tmpdir))
+    directory.save('users', {"alice": "U5NQQHZ11"})
+
+    # jane joined after the cache was written
+    directory = Directory('a', cache_dir=str(tmpdir))
+    assert(directory.user_id('alice') == "U5NQQHZ11")
+    assert(mock_get.call_count == 0)
+    assert(directory.user_id('jane') == "U5NQQHZ12")
+    assert(mock_get.call_count == 1)
+
+    # the rebuilt index is saved, and a name it lacks is missing for good
+    assert(directory.user_id('bob') == "")
+    assert(Directory('a', cache_dir=str(tmpdir)).user_id('jane') ==
+           "U5NQQHZ12")
+    assert(mock_get.call_count == 1)
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_directory_names_by_id(mock_get):
+    mock_get.side_effect = fake_directory
+
+    directory = Directory('a', cache_dir=None)
+
+    assert(directory.user_names() == {"U5NQQHZ11": "alice",
+                                      "U5NQQHZ12": "jane"})
+    assert(directory.channel_names() == {"C8675309": "jenny",
+                                         "D0000001": "U5NQQHZ11"})
+    assert(mock_get.call_count == 2)
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_directory_prefetch(mock_get):
+    mock_get.side_effect = fake_directory
+
+    directory = Directory('a', cache_dir=None)
+    directory.prefetch(users=True, channel_types="public_channel")
+
+    # lookups wait for the background walks instead of starting their own
+    assert(directory.user_id('jane') == "U5NQQHZ12")
+    assert(directory.channel_id('jenny', "public_channel") == "C8675309")
+    assert(mock_get.call_count == 2)
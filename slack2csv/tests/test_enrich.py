@@ -0,0 +1,40 @@
+# Local imports...
+from slack2csv.enrich import compile_enrich
+
+USER_NAMES = {"U5NQQHZ11": "alice", "U5NQQHZ12": "jane"}
+CHANNEL_NAMES = {"C8675309": "jenny", "G2": "secret"}
+
+
+def test_enrich_user_name():
+    enrich = compile_enrich(USER_NAMES, CHANNEL_NAMES)
+
+    msg = enrich({"user": "U5NQQHZ12", "text": "Hey!"})
+    assert(msg["user_name"] == "jane")
+    assert(msg["text_resolved"] == "Hey!")
+
+    msg = enrich({"user": "U0000000", "subtype": "channel_join"})
+    assert(msg["user_name"] is None)
+    assert(msg["text_resolved"] is None)
+
+
+def test_enrich_references():
+    enrich = compile_enrich(USER_NAMES, CHANNEL_NAMES)
+
+    msg = enrich({
+        "user": "U5NQQHZ11",
+        "text": "<@U5NQQHZ12> see <#C8675309> and <#C0000001|random>, "
+                "<@W0000001> and <https://example.com|a link>",
+    })
+
+    # unknown ids keep their label or id, links are left alone
+    assert(msg["text_resolved"] ==
+           "@jane see #jenny and #random, @W0000001 and "
+           "<https://example.com|a link>")
+    assert(msg["text"].startswith("<@U5NQQHZ12>"))
+
+
+def test_enrich_private_channel_references():
+    enrich = compile_enrich(USER_NAMES, CHANNEL_NAMES)
+
+    msg = enrich({"user": "U5NQQHZ11", "text": "moved to <#G2>"})
+    assert(msg["text_resolved"] == "moved to #secret")
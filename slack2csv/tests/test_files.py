@@ -0,0 +1,176 @@
+# Standard library imports...
+import os
+import threading
+import time
+
+# Local imports...
+import slack2csv.slack2csv
+from slack2csv.files import FileStore
+from slack2csv.metrics import Metrics
+from slack2csv.slack2csv import export_conversation, export_conversations
+from slack2csv.tests.fake_slack import FakeSlack
+from slack2csv.writers import open_csv_writer
+
+slack2csv.slack2csv.PACE_REQUESTS = False
+
+
+def downloads(slack):
+    return [params for method, params in slack.log if method == "files"]
+
+
+def test_file_store_downloads_once(tmpdir):
+    with FakeSlack() as slack:
+        metrics = Metrics()
+        store = FileStore(str(tmpdir), 'xoxb-a', metrics=metrics)
+        file = slack.file(1)
+
+        path = store.local_path(file)
+        assert(open(path, 'rb').read() == slack.file_content("F0000001"))
+        assert(os.path.basename(path) == "notes_1.txt")
+        assert(store.local_path(file) == path)
+
+        # the same content under another id is only stored once
+        copy = dict(file, id="F0000099", name="copy.txt")
+        assert(store.local_path(copy) == path)
+
+        # and no file is downloaded again in the next run
+        assert(FileStore(str(tmpdir), 'xoxb-a').local_path(file) == path)
+
+    assert(downloads(slack) == [
+        {"id": "F0000001", "authorization": "Bearer xoxb-a"},
+        {"id": "F0000001", "authorization": "Bearer xoxb-a"},
+    ])
+    assert(metrics.value('files_downloaded') == 2)
+    assert(metrics.value('files_deduplicated') == 1)
+    assert(metrics.value('files_cached') == 1)
+    assert(not os.listdir(str(tmpdir.join("tmp"))))
+
+
+def test_file_store_skips_external_files(tmpdir):
+    store = FileStore(str(tmpdir), 'a')
+    assert(store.local_path({"id": "F1", "is_external": True}) is None)
+
+
+def test_export_downloads_files_of_written_messages(monkeypatch, tmpdir):
+    filename = str(tmpdir.join("out.csv"))
+
+    with FakeSlack(channels={"C1": 6}, files_every=2) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+        store = FileStore(str(tmpdir.join("files")), 'a')
+
+        writer = open_csv_writer(filename)
+        try:
+            assert(export_conversation('a', 'C1', '1', writer,
+                                       'message 2 in', quiet=True,
+                                       files=store) == 1)
+        finally:
+            writer.close()
+
+    assert([params["id"] for params in downloads(slack)] == ["F0000002"])
+    lines = open(filename).read().splitlines()
+    assert(lines[0] == "file_paths,files,text,ts,type,user")
+    assert(lines[1].startswith(store.local_path(slack.file(2)) + ","))
+
+
+def test_export_goes_on_without_failed_files(monkeypatch, tmpdir, capsys):
+    filename = str(tmpdir.join("out.csv"))
+
+    with FakeSlack(channels={"C1": 6}, files_every=2,
+                   missing_files=["F0000002"]) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+        metrics = Metrics()
+        store = FileStore(str(tmpdir.join("files")), 'a', retries=0,
+                          metrics=metrics)
+
+        writer = open_csv_writer(filename)
+        try:
+            assert(export_conversation('a', 'C1', '1', writer, quiet=True,
+                                       files=store) == 6)
+        finally:
+            writer.close()
+
+    assert(metrics.value('files_failed') == 1)
+    assert(metrics.value('files_downloaded') == 2)
+    assert("Could not download file F0000002" in capsys.readouterr().out)
+    rows = [line.split(",")[0] for line in
+            open(filename).read().splitlines()[1:]]
+    assert([bool(path) for path in rows] ==
+           [True, False, False, False, True, False])
+
+
+def test_export_conversations_share_files(monkeypatch, tmpdir):
+    filename = str(tmpdir.join("{channel}.csv"))
+
+    with FakeSlack(channels={"C1": 10, "C2": 10, "C3": 10},
+                   files_every=3) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+        store = FileStore(str(tmpdir.join("files")), 'a', workers=3)
+
+        channels = [{"id": c, "name": c} for c in sorted(slack.channels)]
+        assert(export_conversations('a', channels, '1', filename, workers=3,
+                                    files=store))
+
+    # every channel shares the same four files
+    assert(sorted(params["id"] for params in downloads(slack)) ==
+           ["F0000000", "F0000003", "F0000006", "F0000009"])
+    for channel in channels:
+        rows = open(str(tmpdir.join(channel["id"] + ".csv"))).read()
+        assert(rows.count(str(tmpdir.join("files"))) == 4)
+
+
+def test_export_skips_files_of_filtered_messages(monkeypatch, tmpdir):
+    filename = str(tmpdir.join("out.csv"))
+
+    with FakeSlack() as slack:
+        messages = [
+            {"type": "message", "subtype": "bot_message", "user": "U1",
+             "text": "deployed", "ts": "1.000100", "files": [slack.file(1)]},
+            {"type": "message", "user": "U2", "text": "thanks",
+             "ts": "2.000100", "files": [slack.file(2)]},
+        ]
+        monkeypatch.setattr("slack2csv.slack2csv.fetch_from_slack",
+                            lambda *args, **kwargs: iter(messages))
+        store = FileStore(str(tmpdir.join("files")), 'a')
+
+        writer = open_csv_writer(filename)
+        try:
+            # the bot message is filtered once, not let through the second
+            # time it is looked at
+            assert(export_conversation('a', 'C1', '1', writer, quiet=True,
+                                       prefetch_pages=0, files=store) == 1)
+        finally:
+            writer.close()
+
+    assert([params["id"] for params in downloads(slack)] == ["F0000002"])
+    lines = open(filename).read().splitlines()
+    assert(len(lines) == 2)
+    assert("subtype" not in lines[0])
+    assert(",thanks," in lines[1])
+
+
+def test_file_workers_bound_all_conversations(monkeypatch, tmpdir):
+    filename = str(tmpdir.join("{channel}.csv"))
+    store = FileStore(str(tmpdir.join("files")), 'a', workers=2)
+    running = [0, 0]
+    lock = threading.Lock()
+
+    def download(file, url):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return file["id"]
+
+    monkeypatch.setattr(store, "download", download)
+    with FakeSlack(channels={"C1": 10, "C2": 10, "C3": 10},
+                   files_every=1) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+        channels = [{"id": c, "name": c} for c in sorted(slack.channels)]
+        assert(export_conversations('a', channels, '1', filename, workers=3,
+                                    files=store))
+    store.close()
+
+    # one pool of --file_workers threads, not one per conversation
+    assert(running[1] == 2)
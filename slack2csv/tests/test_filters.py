@@ -0,0 +1,61 @@
+# Standard library imports...
+import pytest
+
+# Local imports...
+from slack2csv.filters import compile_filter
+
+
+def message(**fields):
+    msg = {
+        "type": "message",
+        "user": "U0012345",
+        "text": "deploy finished",
+        "ts": "1513173325.000024",
+    }
+    msg.update(fields)
+    return msg
+
+
+def test_default_filter_matches_original_behavior():
+    keep = compile_filter()
+
+    assert(keep(message()))
+    assert(not keep(message(subtype="bot_message")))
+    assert(not keep(message(user=None)))
+    assert(keep(message(text=None)))
+
+    # other subtypes are kept; the message is left alone, so asking again
+    # gives the same answer
+    msg = message(subtype="bot_message")
+    assert(not keep(msg))
+    assert(not keep(msg))
+    msg = message(subtype="channel_join")
+    assert(keep(msg))
+    assert(msg["subtype"] == "channel_join")
+
+
+@pytest.mark.parametrize("match,text,expected", [
+    ("prefix", "deploy", True),
+    ("prefix", "finished", False),
+    ("substring", "finished", True),
+    ("substring", "failed", False),
+    ("regex", r"^deploy\s+fin", True),
+    ("regex", r"failed$", False),
+])
+def test_text_match_modes(match, text, expected):
+    assert(compile_filter(text, match)(message()) == expected)
+
+
+def test_users_and_subtypes():
+    keep = compile_filter(users=["U1", "U2"],
+                          exclude_subtypes=["bot_message", "channel_join"])
+
+    assert(keep(message(user="U1")))
+    assert(not keep(message(user="U3")))
+    assert(not keep(message(user="U2", subtype="channel_join")))
+    assert(keep(message(user="U2", subtype="thread_broadcast")))
+
+
+def test_unknown_match_mode():
+    with pytest.raises(ValueError):
+        compile_filter("a", "glob")
@@ -0,0 +1,126 @@
+# Standard library imports...
+import json
+import multiprocessing
+import pytest
+
+# Local imports...
+import slack2csv.slack2csv
+from slack2csv.manifest import job_argv, main, manifest_jobs, run_manifest
+from slack2csv.tests.fake_slack import FakeSlack
+
+slack2csv.slack2csv.PACE_REQUESTS = False
+
+
+def test_job_argv():
+    assert(job_argv({"channels": "*", "threads": True, "search": False,
+                     "past_days": 7, "state_file": None}) ==
+           ["--channels", "*", "--past_days", "7", "--threads"])
+
+
+def test_manifest_jobs():
+    manifest = {
+        "defaults": {"past_days": 7, "filename": "out.csv"},
+        "jobs": [
+            {"name": "acme", "token_env": "ACME_TOKEN", "channels": "*"},
+            {"token": "b", "channel": "general", "past_days": 1},
+        ],
+    }
+
+    jobs = manifest_jobs(manifest, {"ACME_TOKEN": "a"})
+
+    assert(jobs == [
+        {"name": "acme", "token": "a",
+         "argv": ["--channels", "*", "--filename", "out.csv",
+                  "--past_days", "7", "--token", "a"]},
+        {"name": "job2", "token": "b",
+         "argv": ["--channel", "general", "--filename", "out.csv",
+                  "--past_days", "1", "--token", "b"]},
+    ])
+
+
+def test_manifest_jobs_invalid(capsys):
+    with pytest.raises(ValueError) as exc_info:
+        manifest_jobs({"jobs": [{"name": "acme", "token_env": "UNSET"}]}, {})
+    assert("UNSET" in str(exc_info.value))
+
+    # checked like the command line, before anything runs
+    with pytest.raises(ValueError) as exc_info:
+        manifest_jobs({"jobs": [{"name": "acme", "token": "a",
+                                 "filename": "out.csv"}]})
+    assert("acme" in str(exc_info.value))
+    assert("--channel" in capsys.readouterr().err)
+
+    with pytest.raises(ValueError):
+        manifest_jobs({"jobs": [
+            {"name": "acme", "token": "a", "filename": "a.csv",
+             "channel": "C1"},
+            {"name": "acme", "token": "b", "filename": "b.csv",
+             "channel": "C1"},
+        ]})
+
+
+def workspace_manifest(tmpdir):
+    return {
+        "defaults": {"past_days": 10000},
+        "jobs": [
+            {"name": "acme-c1", "token": "a", "channel": "C1",
+             "filename": str(tmpdir.join("acme-c1.csv"))},
+            {"name": "acme-c2", "token": "a", "channel": "C2",
+             "filename": str(tmpdir.join("acme-c2.csv"))},
+            {"name": "globex", "token": "b", "channels": "*",
+             "filename": str(tmpdir.join("globex-{channel}.csv"))},
+            {"name": "broken", "token": "c", "channel": "C9",
+             "filename": str(tmpdir.join("broken.csv"))},
+        ],
+    }
+
+
+def check_summary(summary, tmpdir):
+    assert([job["name"] for job in summary["jobs"]] ==
+           ["acme-c1", "acme-c2", "globex", "broken"])
+    assert([job["ok"] for job in summary["jobs"]] ==
+           [True, True, True, False])
+    assert("channel_not_found" in summary["jobs"][3]["error"])
+    assert([job["rows_written"] for job in summary["jobs"]] ==
+           [10, 20, 30, 0])
+    assert(summary["rows_written"] == 60)
+    assert(not summary["ok"])
+    assert(len(open(str(tmpdir.join("acme-c2.csv"))).readlines()) == 21)
+
+
+def test_run_manifest_in_process(monkeypatch, tmpdir, capsys):
+    with FakeSlack(channels={"C1": 10, "C2": 20}) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        summary = run_manifest(manifest_jobs(workspace_manifest(tmpdir)),
+                               processes=1,
+                               log_dir=str(tmpdir.join("logs")))
+
+    check_summary(summary, tmpdir)
+    assert(summary["processes"] == 1)
+    out = capsys.readouterr().out
+    assert("[1/4] acme-c1: 10 rows, 1 requests (0 rate limited)" in out)
+    assert("[4/4] broken: failed" in out)
+    # what the jobs print goes to their logs
+    assert("Exported 20 messages from channel-c2" in
+           open(str(tmpdir.join("logs", "globex.log"))).read())
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason="pool processes need the patched Slack URL")
+def test_run_manifest_processes(monkeypatch, tmpdir, capsys):
+    manifest = str(tmpdir.join("manifest.json"))
+    summary_json = str(tmpdir.join("summary.json"))
+
+    with FakeSlack(channels={"C1": 10, "C2": 20}) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+        with open(manifest, 'w') as f:
+            json.dump(workspace_manifest(tmpdir), f)
+
+        # one process per token
+        assert(main([manifest, '--summary_json', summary_json]) == 1)
+
+    summary = json.load(open(summary_json))
+    check_summary(summary, tmpdir)
+    assert(summary["processes"] == 3)
+    assert("Finished 3 of 4 jobs: 60 rows" in capsys.readouterr().out)
@@ -0,0 +1,80 @@
+# Standard library imports...
+import json
+
+# Local imports...
+from slack2csv.metrics import Metrics
+from slack2csv.slack2csv import SlackClient, export_conversation
+from slack2csv.tests.fake_slack import FakeSlack
+from slack2csv.writers import open_csv_writer
+
+
+def test_metrics_counters_and_timers():
+    metrics = Metrics()
+    metrics.add('bytes_received', 10, method='users.list')
+    metrics.add('bytes_received', 5, method='users.list')
+    metrics.add('rows_written')
+    metrics.observe('request_seconds', 0.5, method='users.list')
+    metrics.observe('request_seconds', 0.25, method='users.list')
+
+    summary = metrics.as_dict()
+    assert(summary['counters'] == [
+        {'name': 'bytes_received', 'labels': {'method': 'users.list'},
+         'value': 15},
+        {'name': 'rows_written', 'labels': {}, 'value': 1},
+    ])
+    assert(summary['timers'] == [
+        {'name': 'request_seconds', 'labels': {'method': 'users.list'},
+         'count': 2, 'sum': 0.75, 'max': 0.5},
+    ])
+
+
+def test_metrics_prometheus(tmpdir):
+    metrics = Metrics()
+    metrics.add('rows_written', 3)
+    metrics.observe('request_seconds', 0.5, method='users.list')
+    path = str(tmpdir.join("slack2csv.prom"))
+    metrics.write_prometheus(path)
+
+    lines = open(path).read().splitlines()
+    assert(lines[:6] == [
+        '# TYPE slack2csv_rows_written_total counter',
+        'slack2csv_rows_written_total 3.0',
+        '# TYPE slack2csv_request_seconds summary',
+        'slack2csv_request_seconds_sum{method="users.list"} 0.5',
+        'slack2csv_request_seconds_count{method="users.list"} 1.0',
+        '# TYPE slack2csv_run_seconds gauge',
+    ])
+    assert(not tmpdir.join("slack2csv.prom.tmp").exists())
+
+
+def test_export_metrics(monkeypatch, tmpdir):
+    metrics = Metrics()
+    filename = str(tmpdir.join("out.csv"))
+
+    with FakeSlack(channels={"C1": 25}, page_size=10,
+                   rate_limit_every=2) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+        client = SlackClient(pace=False, metrics=metrics)
+        writer = open_csv_writer(filename)
+        try:
+            assert(export_conversation('a', 'C1', '1', writer, 'message 1',
+                                       client, quiet=True) == 11)
+        finally:
+            writer.close()
+            client.close()
+
+    assert(metrics.value('rows_written') == 11)
+    assert(metrics.value('rows_filtered') == 14)
+    assert(metrics.value('rate_limited',
+                         method='conversations.history') == 2)
+    assert(metrics.value('bytes_received',
+                         method='conversations.history') > 0)
+    timers = dict((t['name'], t) for t in metrics.as_dict()['timers'])
+    assert(timers['request_seconds']['count'] == 5)
+    assert(timers['decode_seconds']['count'] == 3)
+    assert(timers['sleep_seconds']['labels'] == {'reason': 'retry_after'})
+
+    path = str(tmpdir.join("metrics.json"))
+    metrics.write_json(path)
+    assert(json.load(open(path))['counters'] ==
+           metrics.as_dict()['counters'])
@@ -0,0 +1,102 @@
+# Standard library imports...
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+import pytest
+
+# Local imports...
+from slack2csv.pipeline import ordered_imap, prefetch
+
+
+def test_ordered_imap_keeps_input_order():
+    pool = ThreadPool(4)
+    try:
+        # later items finish first
+        results = list(ordered_imap(lambda i: time.sleep(0.01 * (5 - i)) or
+                                    i * i, range(5), pool, 10))
+    finally:
+        pool.terminate()
+
+    assert(results == [(i, i * i) for i in range(5)])
+
+
+def test_ordered_imap_skips_unwanted():
+    pool = ThreadPool(2)
+    try:
+        results = list(ordered_imap(lambda i: -i, range(6), pool, 3,
+                                    wanted=lambda i: i % 2 == 0))
+    finally:
+        pool.terminate()
+
+    assert(results == [(0, 0), (1, None), (2, -2), (3, None), (4, -4),
+                       (5, None)])
+
+
+def test_ordered_imap_bounded_window():
+    lock = threading.Lock()
+    started = []
+
+    def consume():
+        for i in range(20):
+            with lock:
+                started.append(i)
+            yield i
+
+    pool = ThreadPool(4)
+    try:
+        for item, result in ordered_imap(lambda i: i, consume(), pool, 3):
+            # never more than `window` items read ahead of the consumer
+            assert(len(started) - item <= 4)
+    finally:
+        pool.terminate()
+
+
+def test_prefetch_passes_items_through():
+    items = list(range(25))
+
+    assert(list(prefetch(iter(items), 2, chunk_size=4)) == items)
+    assert(list(prefetch(iter(items), 1, lambda i: i % 10 == 9)) == items)
+    assert(list(prefetch(iter([]), 1)) == [])
+
+
+def test_prefetch_runs_ahead_bounded():
+    produced = []
+
+    def produce():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    items = prefetch(produce(), 2, chunk_size=5)
+    assert(next(items) == 0)
+    time.sleep(0.2)
+    # the chunk being consumed, two queued and one waiting to be queued
+    assert(len(produced) == 4 * 5)
+    items.close()
+
+
+def test_prefetch_raises_errors():
+    def produce():
+        yield 1
+        raise ValueError("boom")
+
+    items = prefetch(produce(), 2, chunk_size=1)
+    assert(next(items) == 1)
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_prefetch_close_stops_producer():
+    closed = threading.Event()
+
+    def produce():
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            closed.set()
+
+    items = prefetch(produce(), 1, chunk_size=1)
+    assert(next(items) == 0)
+    items.close()
+    assert(closed.wait(2))
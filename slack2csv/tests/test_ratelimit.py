@@ -0,0 +1,55 @@
+# Standard library imports...
+from mock import patch
+
+# Local imports...
+from slack2csv.ratelimit import RateLimiter, TokenBucket
+
+
+def test_token_bucket_burst_then_paced():
+    bucket = TokenBucket(rate=1, capacity=2)
+    now = bucket.updated
+
+    # The first requests ride the burst, after that they are spaced out.
+    assert(bucket.reserve(now) == 0)
+    assert(bucket.reserve(now) == 0)
+    assert(bucket.reserve(now) == 1)
+    assert(bucket.reserve(now) == 2)
+
+    # Waiting refills the bucket.
+    assert(bucket.reserve(now + 10) == 0)
+
+
+@patch('slack2csv.ratelimit.time.sleep')
+def test_rate_limiter_paces_per_method(mock_sleep):
+    limiter = RateLimiter(rates={2: 60, 3: 60}, burst=1)
+
+    assert(limiter.wait('users.list') == 0)
+    assert(limiter.wait('conversations.history') == 0)
+    # Same method as the first call, so this one has to wait.
+    assert(limiter.wait('users.list') > 0)
+    # Unknown methods are never paced.
+    assert(limiter.wait('api.test') == 0)
+    assert(mock_sleep.call_count == 1)
+    assert(limiter.throttled_seconds > 0)
+
+
+def test_rate_limiter_methods_of_a_tier_do_not_share():
+    limiter = RateLimiter(rates={2: 60, 3: 60}, burst=1)
+
+    # Slack limits every method on its own, at the rate of its tier
+    assert(limiter.reserve('conversations.history') == 0)
+    assert(limiter.reserve('conversations.replies') == 0)
+    assert(limiter.reserve('users.list') == 0)
+    assert(limiter.reserve('conversations.list') == 0)
+    assert(limiter.reserve('conversations.list') > 0)
+    assert(limiter.throttled_seconds < 1.5)
+
+
+def test_rate_limiter_penalize_blocks_method():
+    limiter = RateLimiter(rates={3: 6000}, burst=10)
+
+    assert(limiter.penalize('conversations.history', 5) == 5)
+    assert(limiter.reserve('conversations.history') > 4)
+    assert(limiter.reserve('conversations.replies') == 0)
+    assert(limiter.reserve('users.list') == 0)
+    assert(limiter.rate_limited == 1)
@@ -1,17 +1,21 @@
 # Standard library imports...
 from os import environ
+import time
 import pytest
-from mock import Mock, patch
+from mock import ANY, Mock, patch
 
 # Local imports...
 import slack2csv.slack2csv
-from slack2csv.slack2csv import fetch_from_slack, lookup_channel_id_by_name, lookup_user_id_by_name
+from slack2csv import fastjson
+from slack2csv.slack2csv import SlackClient, export_conversation, export_conversations, fetch_from_search, fetch_from_slack, fetch_from_slack_sliced, history_url, lookup_channel_id_by_name, lookup_user_id_by_name, message_fields, select_conversations, slice_bounds, with_thread_replies
+from slack2csv.tests.fake_slack import FakeSlack
 
 # turn down the timeout, so the tests run faster
 slack2csv.slack2csv.QUERY_API_TIMEOUT = 0
+slack2csv.slack2csv.PACE_REQUESTS = False
 
 
-@patch('slack2csv.slack2csv.requests.get')
+@patch('slack2csv.slack2csv.requests.Session.get')
 def test_lookup_channel_id_by_name_success(mock_get):
     true = 1
     false = 0
@@ -35,7 +39,7 @@ def test_lookup_channel_id_by_name_success(mock_get):
     assert(messages == "C8675309")
 
 
-@patch('slack2csv.slack2csv.requests.get')
+@patch('slack2csv.slack2csv.requests.Session.get')
 def test_lookup_channel_id_by_name_fail(mock_get):
     true = 1
     false = 0
@@ -59,7 +63,7 @@ def test_lookup_channel_id_by_name_fail(mock_get):
     assert(messages == "")
 
 
-@patch('slack2csv.slack2csv.requests.get')
+@patch('slack2csv.slack2csv.requests.Session.get')
 def test_lookup_channel_id_by_name_paged(mock_get):
     true = 1
     false = 0
@@ -97,7 +101,7 @@ def test_lookup_channel_id_by_name_paged(mock_get):
     assert(messages == "C8675309")
 
 
-@patch('slack2csv.slack2csv.requests.get')
+@patch('slack2csv.slack2csv.requests.Session.get')
 def test_fetch_from_slack_success(mock_get):
     true = 1
     false = 0
@@ -124,7 +128,7 @@ def test_fetch_from_slack_success(mock_get):
     assert(len(messages) == 1)
 
 
-@patch('slack2csv.slack2csv.requests.get')
+@patch('slack2csv.slack2csv.requests.Session.get')
 def test_fetch_from_slack_fail(mock_get):
 
     true = 1
@@ -153,7 +157,7 @@ def test_fetch_from_slack_fail(mock_get):
     assert "I'm an error" in str(exc_info.value)
 
 
-@patch('slack2csv.slack2csv.requests.get')
+@patch('slack2csv.slack2csv.requests.Session.get')
 def test_fetch_from_slack_paged(mock_get):
     true = 1
     false = 0
@@ -200,7 +204,7 @@ def test_fetch_from_slack_paged(mock_get):
     assert(len(messages) == 3)
 
 
-@patch('slack2csv.slack2csv.requests.get')
+@patch('slack2csv.slack2csv.requests.Session.get')
 def test_lookup_user_id_by_name_success(mock_get):
     true = 1
     false = 0
@@ -225,7 +229,7 @@ def test_lookup_user_id_by_name_success(mock_get):
     assert(user_id == "U5NQQHZ11")
 
 
-@patch('slack2csv.slack2csv.requests.get')
+@patch('slack2csv.slack2csv.requests.Session.get')
 def test_lookup_user_id_by_name_fail(mock_get):
     true = 1
     false = 0
@@ -250,7 +254,7 @@ def test_lookup_user_id_by_name_fail(mock_get):
     assert(user_id == "")
 
 
-@patch('slack2csv.slack2csv.requests.get')
+@patch('slack2csv.slack2csv.requests.Session.get')
 def test_lookup_user_id_by_name_paged(mock_get):
     true = 1
     false = 0
@@ -289,3 +293,337 @@ def test_lookup_user_id_by_name_paged(mock_get):
 
     # If the request is sent successfully, then I expect a response to be returned.
     assert(user_id == "U5NQQHZ11")
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_slack_client_shared_session(mock_get):
+    true = 1
+    fake_response = {
+        "ok": true,
+        "channels": [{
+            "id": "C8675309",
+            "name": "jenny",
+        }],
+        "messages": [{
+            "type": "message",
+            "user": "U0012345",
+            "text": "Hey!",
+            "ts": "1513173325.000024"
+        }]
+    }
+
+    mock_get.return_value.json.return_value = fake_response
+
+    client = SlackClient(pool_size=4, timeout=5, retries=1)
+
+    # Both the lookup and the history fetch go through the same session.
+    assert(lookup_channel_id_by_name('a', 'jenny', client=client) == "C8675309")
+    assert(len(list(fetch_from_slack('a', 'C8675309', '1', client))) == 1)
+    assert(mock_get.call_count == 2)
+    mock_get.assert_called_with(ANY, timeout=5)
+
+    adapter = client.session.get_adapter("https://slack.com/api/")
+    assert(adapter._pool_maxsize == 4)
+    assert(adapter.max_retries.total == 1)
+
+
+@patch('slack2csv.slack2csv.time.sleep')
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_slack_client_retry_after(mock_get, mock_sleep):
+    true = 1
+    limited = Mock(status_code=429, headers={"Retry-After": "7"})
+    ok = Mock(status_code=200)
+    ok.json.return_value = {
+        "ok": true,
+        "members": [{
+            "id": "U5NQQHZ11",
+            "name": "alice",
+        }]
+    }
+    mock_get.side_effect = [limited, ok]
+
+    client = SlackClient(pace=False)
+
+    # The 429 is retried after waiting for as long as Slack asked.
+    assert(lookup_user_id_by_name('a', 'alice', client) == "U5NQQHZ11")
+    mock_sleep.assert_called_once_with(7.0)
+    assert(client.requests == 2)
+    assert(client.limiter.rate_limited == 1)
+
+
+@patch('slack2csv.slack2csv.time.sleep')
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_slack_client_rate_limited_gives_up(mock_get, mock_sleep):
+    mock_get.return_value = Mock(status_code=429, headers={})
+
+    client = SlackClient(retries=2, pace=False)
+
+    with pytest.raises(ValueError) as exc_info:
+        lookup_user_id_by_name('a', 'alice', client)
+
+    assert "users.list" in str(exc_info.value)
+    assert(mock_get.call_count == 3)
+
+
+def fake_workspace(url, timeout=None):
+    true = 1
+    response = Mock(status_code=200)
+    if "conversations.list" in url:
+        response.json.return_value = {
+            "ok": true,
+            "channels": [
+                {"id": "C1", "name": "team-a"},
+                {"id": "C2", "name": "team-b"},
+                {"id": "C3", "name": "random"},
+            ]
+        }
+    else:
+        channel = url.split("&channel=")[1].split("&")[0]
+        response.json.return_value = {
+            "ok": true,
+            "messages": [{
+                "type": "message",
+                "user": "U0012345",
+                "text": "Hey " + channel,
+                "ts": "1513173325.000024"
+            }]
+        }
+    return response
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_select_conversations_globs(mock_get):
+    mock_get.side_effect = fake_workspace
+
+    channels = list(select_conversations('a', 'team-*, C3'))
+
+    assert([c["id"] for c in channels] == ["C1", "C2", "C3"])
+
+
+def test_select_conversations_filters(monkeypatch):
+    with FakeSlack(channels={"C1": 5, "C2": 20, "C3": 30},
+                   archived=["C3"]) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        channels = list(select_conversations('a', '*', exclude_archived=True,
+                                              min_members=10))
+        assert([c["id"] for c in channels] == ["C2"])
+        assert(slack.log[-1][1]["exclude_archived"] == "true")
+
+        # C1 was last updated when its fifth message was posted
+        exported = {"C1": "1500000005.000100", "C2": "1500000005.000100"}
+        channels = list(select_conversations('a', '*',
+                                             exported_until=exported.get))
+        assert([c["id"] for c in channels] == ["C2", "C3"])
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_export_conversations_merged(mock_get, tmpdir):
+    mock_get.side_effect = fake_workspace
+    filename = str(tmpdir.join("merged.csv"))
+
+    channels = list(select_conversations('a', 'team-*'))
+    assert(export_conversations('a', channels, '1', filename, workers=2))
+
+    lines = open(filename).read().splitlines()
+    assert(lines[0] == "channel,text,ts,type,user")
+    assert(sorted(lines[1:]) == [
+        "C1,Hey C1,1513173325.000024,message,U0012345",
+        "C2,Hey C2,1513173325.000024,message,U0012345",
+    ])
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_export_conversations_per_channel(mock_get, tmpdir):
+    mock_get.side_effect = fake_workspace
+    filename = str(tmpdir.join("{channel}.csv"))
+
+    channels = list(select_conversations('a', '*'))
+    assert(export_conversations('a', channels, '1', filename, workers=3))
+
+    for name, id in [("team-a", "C1"), ("team-b", "C2"), ("random", "C3")]:
+        lines = open(str(tmpdir.join(name + ".csv"))).read().splitlines()
+        assert(lines == ["text,ts,type,user",
+                         "Hey " + id + ",1513173325.000024,message,U0012345"])
+
+
+def test_history_url_rounds_oldest_down():
+    # e.g. resuming after the last exported message of a checkpoint
+    assert(history_url('a', 'C1', '1500000000.600000').endswith(
+        "&oldest=1500000000"))
+    assert(history_url('a', 'C1', 1500000000.6, 1500000100).endswith(
+        "&oldest=1500000000&latest=1500000100"))
+
+
+def test_slice_bounds():
+    assert(slice_bounds(100.4, 200, 4) == [100, 125, 150, 175])
+    assert(slice_bounds(100, 200, 1) == [100])
+
+
+def test_fetch_from_slack_sliced_matches_serial(monkeypatch):
+    start = int(time.time()) - 1000
+    with FakeSlack(channels={"C1": 900}, page_size=7, start=start) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        serial = list(fetch_from_slack('a', 'C1', start, quiet=True))
+        sliced = list(fetch_from_slack_sliced('a', 'C1', start, 6,
+                                              quiet=True, buffer_pages=2))
+
+    assert(len(serial) == 900)
+    assert(sliced == serial)
+
+
+def test_fetch_from_slack_sliced_error(monkeypatch):
+    with FakeSlack(channels={}) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        with pytest.raises(ValueError) as exc_info:
+            list(fetch_from_slack_sliced('a', 'C1', '1', 3, quiet=True))
+
+    assert "channel_not_found" in str(exc_info.value)
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_fetch_from_search_paged(mock_get):
+    true = 1
+    fake_response = [{
+        "ok": true,
+        "messages": {
+            "matches": [{
+                "type": "message",
+                "user": "U0012345",
+                "text": "deploy started",
+                "ts": "1513000000.000001",
+                "channel": {"id": "C1", "name": "ops"},
+                "permalink": "https://example.slack.com/p1",
+            }, {
+                "type": "message",
+                "user": "U0012345",
+                "text": "deploy done",
+                "ts": "1513173325.000024",
+                "channel": {"id": "C1", "name": "ops"},
+                "permalink": "https://example.slack.com/p2",
+            }],
+            "paging": {"page": 1, "pages": 2},
+        }
+    }, {
+        "ok": true,
+        "messages": {
+            "matches": [{
+                "type": "message",
+                "user": "U0012346",
+                "text": "deploy again",
+                "ts": "1513173326.000024",
+            }],
+            "paging": {"page": 2, "pages": 2},
+        }
+    }]
+    mock_get.return_value.json.side_effect = fake_response
+
+    messages = list(fetch_from_search('a', 'C1', 1513100000, 'deploy'))
+
+    # messages before oldest are dropped, like search-only fields
+    assert([m["ts"] for m in messages] ==
+           ["1513173325.000024", "1513173326.000024"])
+    assert("channel" not in messages[0])
+    assert("permalink" not in messages[0])
+
+    url = mock_get.call_args_list[0][0][0]
+    assert("search.messages?token=a&query=%22deploy%22%20in%3A%3C%23C1%3E"
+           "%20after%3A" in url)
+    assert(mock_get.call_args_list[1][0][0].endswith("&page=2"))
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_fetch_from_search_fail(mock_get):
+    false = 0
+    mock_get.return_value.json.return_value = {
+        "ok": false,
+        "error": "not_allowed_token_type",
+    }
+
+    with pytest.raises(ValueError) as exc_info:
+        list(fetch_from_search('a', 'C1', 1, 'deploy'))
+
+    assert "not_allowed_token_type" in str(exc_info.value)
+
+
+def test_with_thread_replies(monkeypatch):
+    with FakeSlack(channels={"C1": 10}, page_size=3, thread_every=4,
+                   replies=5) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        history = list(fetch_from_slack('a', 'C1', 1, quiet=True))
+        messages = list(with_thread_replies(iter(history), 'a', 'C1',
+                                            workers=2, window=2))
+
+    # messages 0, 4 and 8 start threads of 5 replies each
+    assert(len(messages) == 10 + 3 * 5)
+    assert(messages[0] == history[0])
+    assert([m["text"] for m in messages[1:6]] ==
+           ["reply {0} to 0 in C1".format(j) for j in range(5)])
+    assert(messages[6] == history[1])
+    assert([m["ts"] for m in messages[-7:]] ==
+           ["1500000008.000100"] +
+           ["1500000008.{0:06d}".format(200 + j) for j in range(5)] +
+           ["1500000009.000100"])
+
+
+def test_with_thread_replies_dedupes_broadcasts():
+    parent = {"ts": "1.000100", "thread_ts": "1.000100", "reply_count": 2}
+    reply = {"ts": "1.000200", "thread_ts": "1.000100"}
+    broadcast = {"ts": "1.000300", "thread_ts": "1.000100",
+                 "subtype": "thread_broadcast"}
+    other = {"ts": "2.000100"}
+
+    with patch('slack2csv.slack2csv.fetch_replies',
+               return_value=[reply, broadcast]) as mock_fetch:
+        # the broadcast also shows up in the channel history
+        messages = list(with_thread_replies(
+            iter([parent, broadcast, other]), 'a', 'C1'))
+
+    mock_fetch.assert_called_once_with('a', 'C1', "1.000100", None)
+    assert(messages == [parent, reply, broadcast, other])
+
+
+def test_fast_json_decoding_matches_requests(monkeypatch):
+    with FakeSlack(channels={"C1": 30}, page_size=7) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        plain = SlackClient(pace=False)
+        fast = SlackClient(pace=False, json_loads=fastjson.loads)
+        assert(list(fetch_from_slack('a', 'C1', 1, fast, quiet=True)) ==
+               list(fetch_from_slack('a', 'C1', 1, plain, quiet=True)))
+
+
+def test_message_fields():
+    assert(message_fields(["ts", "reactions.0.name", "files.0.url"]) ==
+           frozenset(["reply_count", "subtype", "text", "thread_ts", "ts",
+                      "user", "reactions", "files"]))
+
+
+@patch('slack2csv.slack2csv.requests.Session.get')
+def test_export_conversation_fields(mock_get):
+    true = 1
+    mock_get.return_value.json.return_value = {
+        "ok": true,
+        "messages": [{
+            "type": "message",
+            "user": "U0012345",
+            "text": "Hey!",
+            "ts": "1513173325.000024",
+            "blocks": [{"type": "rich_text"}],
+            "attachments": [{"fallback": "big"}],
+        }]
+    }
+    writer = Mock(needs_channel=False)
+
+    export_conversation('a', 'C1', 1, writer, quiet=True,
+                        fields=message_fields(["ts", "text"]))
+
+    # blocks and attachments are dropped before the writer sees them
+    writer.write.assert_called_once_with({
+        "user": "U0012345",
+        "text": "Hey!",
+        "ts": "1513173325.000024",
+    })
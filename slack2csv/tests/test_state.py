@@ -0,0 +1,143 @@
+# Standard library imports...
+import json
+import pytest
+
+# Local imports...
+import slack2csv.slack2csv
+from slack2csv.slack2csv import export_conversation
+from slack2csv.state import ExportState
+from slack2csv.tests.fake_slack import FakeSlack
+from slack2csv.writers import open_csv_writer
+
+slack2csv.slack2csv.PACE_REQUESTS = False
+
+
+class FailingWriter(object):
+    # stands in for a crash after `limit` rows
+
+    def __init__(self, writer, limit):
+        self.writer = writer
+        self.limit = limit
+
+    def write(self, msg):
+        if self.writer.count == self.limit:
+            raise KeyboardInterrupt()
+        self.writer.write(msg)
+
+    def flush(self):
+        self.writer.flush()
+
+
+def export(token, channel, filename, state, wrap=None):
+    writer = open_csv_writer(filename, append=True)
+    try:
+        return export_conversation(token, channel, '1',
+                                   wrap(writer) if wrap else writer,
+                                   quiet=True, state=state)
+    finally:
+        writer.close()
+
+
+def test_incremental_export_appends_new_messages(monkeypatch, tmpdir):
+    filename = str(tmpdir.join("out.csv"))
+    state_file = str(tmpdir.join("state.json"))
+
+    with FakeSlack(channels={"C1": 10}, page_size=4) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        assert(export('a', 'C1', filename, ExportState(state_file)) == 10)
+        saved = json.load(open(state_file))['conversations']['C1']
+        assert(saved == {"ts": "1500000009.000100", "cursor": None,
+                         "oldest": None})
+
+        # nothing new, nothing written
+        assert(export('a', 'C1', filename, ExportState(state_file)) == 0)
+
+        slack.channels["C1"] = 13
+        assert(export('a', 'C1', filename, ExportState(state_file)) == 3)
+
+    lines = open(filename).read().splitlines()
+    assert(lines[0] == "text,ts,type,user")
+    assert(len(lines) == 14)
+    assert([l.split(",")[0] for l in lines[1:]] ==
+           ["message {0} in C1".format(i) for i in range(13)])
+
+
+def test_incremental_export_resumes_from_cursor(monkeypatch, tmpdir):
+    filename = str(tmpdir.join("out.csv"))
+    state_file = str(tmpdir.join("state.json"))
+
+    with FakeSlack(channels={"C1": 10}, page_size=4) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        # crash in the middle of the second page; later pages may have
+        # been fetched ahead already, but were not written
+        with pytest.raises(KeyboardInterrupt):
+            export('a', 'C1', filename, ExportState(state_file),
+                   wrap=lambda writer: FailingWriter(writer, 6))
+        saved = json.load(open(state_file))['conversations']['C1']
+        assert(saved["cursor"] == "4")
+        assert(saved["ts"] == "1500000003.000100")
+
+        # the first page is not fetched again
+        assert(export('a', 'C1', filename, ExportState(state_file)) == 6)
+        cursors = [params.get("cursor") for method, params in slack.log]
+        assert(cursors.count(None) == 1)
+        assert(cursors.count("4") == 2)
+
+    lines = open(filename).read().splitlines()
+    # rows of the interrupted page are written again
+    assert(len(lines) == 1 + 6 + 6)
+    assert(lines[-1].startswith("message 9 in C1,"))
+
+
+def test_incremental_export_with_threads(monkeypatch, tmpdir):
+    filename = str(tmpdir.join("out.csv"))
+    state_file = str(tmpdir.join("state.json"))
+
+    with FakeSlack(channels={"C1": 6}, page_size=4, thread_every=5,
+                   replies=2) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        writer = open_csv_writer(filename, append=True)
+        try:
+            assert(export_conversation('a', 'C1', '1', writer, quiet=True,
+                                       state=ExportState(state_file),
+                                       threads=True) == 6 + 2 * 2)
+        finally:
+            writer.close()
+
+    # replies are newer than their parents, but only channel messages move
+    # the checkpoint
+    saved = json.load(open(state_file))['conversations']['C1']
+    assert(saved["ts"] == "1500000005.000100")
+
+
+def test_skip_unchanged_channels(monkeypatch, tmpdir):
+    filename = str(tmpdir.join("{channel}.csv"))
+    state_file = str(tmpdir.join("state.json"))
+    argv = ['--token', 'a', '--filename', filename, '--channels', '*',
+            '--state_file', state_file, '--skip_unchanged',
+            '--past_days', '10000', '--cache_dir', '']
+
+    with FakeSlack(channels={"C1": 3, "C2": 4, "C3": 5}) as slack:
+        monkeypatch.setattr("slack2csv.slack2csv.SLACK_API_URL", slack.url)
+
+        def walked():
+            channels = [params["channel"] for method, params in slack.log
+                        if method == "conversations.history"]
+            del slack.log[:]
+            return sorted(channels)
+
+        assert(slack2csv.slack2csv.main(argv))
+        assert(walked() == ["C1", "C2", "C3"])
+
+        assert(slack2csv.slack2csv.main(argv))
+        assert(walked() == [])
+
+        slack.channels["C2"] += 2
+        assert(slack2csv.slack2csv.main(argv))
+        assert(walked() == ["C2"])
+
+    lines = open(str(tmpdir.join("channel-c2.csv"))).read().splitlines()
+    assert(len(lines) == 1 + 6)
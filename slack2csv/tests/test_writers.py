@@ -0,0 +1,271 @@
+# Standard library imports...
+import json
+import sqlite3
+import threading
+import pytest
+
+# Local imports...
+from slack2csv.writers import SQLITE_FTS_SCHEMAS, ParquetWriter, compile_columns, open_csv_writer, open_partitioned_writer, open_writer
+
+MESSAGES = [{
+    "type": "message",
+    "user": "U0012345",
+    "text": "Hey!",
+    "ts": "1513173325.000024",
+}, {
+    "type": "message",
+    "user": "U0012346",
+    "text": "Ho!",
+    "ts": "1513173326.000024",
+    "reactions": [{"name": "tada", "count": 2}],
+}]
+
+
+def test_compile_columns_flat():
+    project = compile_columns(["ts", "reactions", "missing"])
+
+    assert(project(MESSAGES[1]) == [
+        "1513173326.000024", '[{"count": 2, "name": "tada"}]', None])
+
+
+def test_compile_columns_dotted_paths():
+    project = compile_columns(["user", "reactions.0.name", "reactions.1.name",
+                               "text.length"])
+
+    assert(project(MESSAGES[0]) == ["U0012345", None, None, None])
+    assert(project(MESSAGES[1]) == ["U0012346", "tada", None, None])
+
+
+def write(filename, messages, **kwargs):
+    writer = open_writer(filename, **kwargs)
+    for msg in messages:
+        writer.write(dict(msg))
+    writer.close()
+    return open(filename).read().splitlines()
+
+
+def test_first_row_schema(tmpdir):
+    lines = write(str(tmpdir.join("out.csv")), MESSAGES)
+
+    # keys that only show up later are not in the header
+    assert(lines == ["text,ts,type,user",
+                     "Hey!,1513173325.000024,message,U0012345",
+                     "Ho!,1513173326.000024,message,U0012346"])
+
+
+def test_union_schema(tmpdir):
+    lines = write(str(tmpdir.join("out.csv")), MESSAGES, schema='union')
+
+    assert(lines == [
+        "reactions,text,ts,type,user",
+        ",Hey!,1513173325.000024,message,U0012345",
+        '"[{""count"": 2, ""name"": ""tada""}]",Ho!,1513173326.000024,'
+        'message,U0012346'])
+    # the spool file is gone
+    assert(tmpdir.listdir() == [tmpdir.join("out.csv")])
+
+
+def test_fixed_columns(tmpdir):
+    lines = write(str(tmpdir.join("out.csv")), MESSAGES,
+                  columns=["ts", "reactions.0.name"])
+
+    assert(lines == ["ts,reactions.0.name",
+                     "1513173325.000024,",
+                     "1513173326.000024,tada"])
+
+
+def test_append_keeps_existing_header(tmpdir):
+    filename = str(tmpdir.join("out.csv"))
+    write(filename, MESSAGES[:1], columns=["user", "ts"])
+
+    lines = write(filename, MESSAGES[1:], append=True)
+
+    assert(lines == ["user,ts",
+                     "U0012345,1513173325.000024",
+                     "U0012346,1513173326.000024"])
+
+
+def test_jsonl_format(tmpdir):
+    lines = write(str(tmpdir.join("out.jsonl")), MESSAGES, format='jsonl')
+
+    assert([json.loads(line) for line in lines] == MESSAGES)
+
+
+def test_jsonl_format_columns(tmpdir):
+    lines = write(str(tmpdir.join("out.jsonl")), MESSAGES, format='jsonl',
+                  columns=["ts", "reactions.0"])
+
+    assert([json.loads(line) for line in lines] == [
+        {"ts": "1513173325.000024", "reactions.0": None},
+        {"ts": "1513173326.000024",
+         "reactions.0": {"name": "tada", "count": 2}},
+    ])
+
+
+def test_parquet_format_row_groups(tmpdir):
+    pq = pytest.importorskip("pyarrow.parquet")
+    filename = str(tmpdir.join("out.parquet"))
+
+    writer = ParquetWriter(filename, row_group_size=2)
+    for i in range(5):
+        writer.write(dict(MESSAGES[i % 2], ts=str(i)))
+    writer.close()
+
+    parquet_file = pq.ParquetFile(filename)
+    assert(parquet_file.num_row_groups == 3)
+    table = parquet_file.read()
+    # the columns come from the first row group
+    assert(table.column_names == ["reactions", "text", "ts", "type", "user"])
+    assert(table.column("ts").to_pylist() == ["0", "1", "2", "3", "4"])
+    assert(table.column("reactions").to_pylist()[:2] == [
+        None, '[{"count": 2, "name": "tada"}]'])
+
+
+def test_parquet_union_schema(tmpdir):
+    pq = pytest.importorskip("pyarrow.parquet")
+    filename = str(tmpdir.join("out.parquet"))
+
+    writer = open_writer(filename, format='parquet', schema='union')
+    writer.row_group_size = 2
+    for i in range(5):
+        writer.write({"ts": str(i)})
+    # a key first seen after the first row group
+    writer.write(dict(MESSAGES[1], ts="5"))
+    writer.flush()
+    writer.close()
+
+    parquet_file = pq.ParquetFile(filename)
+    assert(parquet_file.num_row_groups == 3)
+    table = parquet_file.read()
+    assert(table.column_names == ["reactions", "text", "ts", "type", "user"])
+    assert(table.column("ts").to_pylist() == ["0", "1", "2", "3", "4", "5"])
+    assert(table.column("text").to_pylist() == [None] * 5 + ["Ho!"])
+
+
+def test_parquet_format_empty(tmpdir):
+    pq = pytest.importorskip("pyarrow.parquet")
+    filename = str(tmpdir.join("out.parquet"))
+
+    open_writer(filename, format='parquet', columns=["ts", "text"]).close()
+
+    table = pq.read_table(filename)
+    assert(table.column_names == ["ts", "text"])
+    assert(table.num_rows == 0)
+
+
+@pytest.mark.parametrize("fts", ["fts5", "fts4"])
+def test_sqlite_format_upserts(monkeypatch, tmpdir, fts):
+    monkeypatch.setattr("slack2csv.writers.SQLITE_FTS_SCHEMAS",
+                        [schema for schema in SQLITE_FTS_SCHEMAS
+                         if schema[0] == fts])
+    filename = str(tmpdir.join("out.db"))
+    writer = open_writer(filename, format='sqlite')
+    writer.batch_size = 1
+    for msg in MESSAGES:
+        writer.write(dict(msg, channel="C1"))
+    writer.close()
+
+    # exporting again updates messages in place
+    writer = open_writer(filename, append=True, format='sqlite')
+    writer.write(dict(MESSAGES[0], channel="C1", text="Hey you!"))
+    writer.write(dict(MESSAGES[0], channel="C2"))
+    # messages without a ts can not be keyed
+    writer.write({"channel": "C2", "text": "Hey?"})
+    writer.close()
+
+    db = sqlite3.connect(filename)
+    rows = db.execute("SELECT channel, ts, user, text FROM messages "
+                      "ORDER BY channel, ts").fetchall()
+    assert(rows == [
+        ("C1", "1513173325.000024", "U0012345", "Hey you!"),
+        ("C1", "1513173326.000024", "U0012346", "Ho!"),
+        ("C2", "1513173325.000024", "U0012345", "Hey!"),
+    ])
+    stored = json.loads(db.execute("SELECT json FROM messages WHERE text = ?",
+                                   ("Ho!",)).fetchone()[0])
+    assert(stored["reactions"] == MESSAGES[1]["reactions"])
+
+    # the full text index follows the updates
+    matches = db.execute("SELECT m.channel FROM messages_fts f JOIN messages "
+                         "m ON m.rowid = f.rowid WHERE messages_fts MATCH "
+                         "'hey' ORDER BY m.channel").fetchall()
+    assert(matches == [("C1",), ("C2",)])
+    assert(db.execute("SELECT count(*) FROM messages_fts WHERE messages_fts "
+                      "MATCH 'you'").fetchone() == (1,))
+
+    # and deletes
+    with db:
+        db.execute("DELETE FROM messages WHERE channel = 'C2'")
+    assert(db.execute("SELECT count(*) FROM messages_fts WHERE messages_fts "
+                      "MATCH 'hey'").fetchone() == (1,))
+
+
+def test_sqlite_format_batches(tmpdir):
+    filename = str(tmpdir.join("out.db"))
+    writer = open_writer(filename, format='sqlite')
+    writer.batch_size = 2
+    for i in range(3):
+        writer.write({"channel": "C1", "ts": "{0}.000100".format(i)})
+
+    # one full batch is committed, the rest waits for flush()
+    db = sqlite3.connect(filename)
+    assert(db.execute("SELECT count(*) FROM messages").fetchone() == (2,))
+    writer.flush()
+    assert(db.execute("SELECT count(*) FROM messages").fetchone() == (3,))
+    writer.close()
+
+
+def day_messages(day, count):
+    # `count` messages a second apart from midnight UTC of 2017-12-`day`
+    start = 1512086400 + (day - 1) * 86400
+    return [{"text": "m{0}".format(i), "ts": "{0}.000100".format(start + i)}
+            for i in range(count)]
+
+
+def test_partitioned_writer_rolls_over(tmpdir):
+    filename = str(tmpdir.join("C1", "{period}", "part.csv"))
+    opened = []
+
+    def open_output(filename, append):
+        opened.append((filename[len(str(tmpdir)) + 1:], append))
+        return open_csv_writer(filename, append)
+
+    writer = open_partitioned_writer(filename, partition='day',
+                                     open_writer=open_output, max_open=1)
+    # a reply in an earlier day makes its file open again
+    for msg in day_messages(1, 2) + day_messages(2, 2) + day_messages(1, 1):
+        writer.write(msg)
+    writer.close()
+
+    assert(opened == [("C1/2017-12-01/part.csv", False),
+                      ("C1/2017-12-02/part.csv", False),
+                      ("C1/2017-12-01/part.csv", True)])
+    assert(open(str(tmpdir.join("C1", "2017-12-01", "part.csv")))
+           .read().splitlines() == ["text,ts", "m0,1512086400.000100",
+                                    "m1,1512086401.000100",
+                                    "m0,1512086400.000100"])
+    assert(len(tmpdir.join("C1", "2017-12-02", "part.csv").readlines()) == 3)
+
+
+def test_partitioned_writer_threads(tmpdir):
+    filename = str(tmpdir.join("{period}.jsonl"))
+    writer = open_partitioned_writer(
+        filename, partition='month',
+        open_writer=lambda filename, append: open_writer(
+            filename, append, format='jsonl'), max_open=2)
+
+    def export(month):
+        start = 1483228800 + month * 31 * 86400
+        for i in range(500):
+            writer.write({"ts": "{0}.000100".format(start + i * 60)})
+
+    threads = [threading.Thread(target=export, args=(month,))
+               for month in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    for month in ("2017-01", "2017-02", "2017-03", "2017-04"):
+        assert(len(tmpdir.join(month + ".jsonl").readlines()) == 500)
@@ -0,0 +1,578 @@
+import csv
+import json
+import os
+from collections import OrderedDict
+import sqlite3
+import tempfile
+import threading
+import time
+
+from .compression import (DEFAULT_BUFFER_SIZE, open_input_file,
+                          open_output_file)
+
+# rows buffered per Parquet row group
+DEFAULT_ROW_GROUP_SIZE = 10000
+
+# rows upserted per SQLite transaction
+DEFAULT_SQLITE_BATCH_SIZE = 5000
+
+# replaced by the day or month of the messages in partitioned output
+PERIOD_PLACEHOLDER = "{period}"
+PERIOD_FORMATS = {
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+}
+
+# partition files a PartitionedWriter keeps open at a time
+DEFAULT_OPEN_PARTITIONS = 16
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    channel TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    ts_epoch REAL NOT NULL,
+    user TEXT,
+    thread_ts TEXT,
+    type TEXT,
+    text TEXT,
+    json TEXT NOT NULL,
+    PRIMARY KEY (channel, ts)
+);
+CREATE INDEX IF NOT EXISTS messages_user ON messages (user, ts_epoch);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts_epoch);
+CREATE INDEX IF NOT EXISTS messages_thread ON messages (channel, thread_ts);
+"""
+
+# full text index on messages.text, kept in sync by triggers; FTS5 where
+# SQLite was built with it, FTS4 otherwise
+SQLITE_FTS5_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+    USING fts5(text, content='messages', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text)
+        VALUES ('delete', old.rowid, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages
+BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text)
+        VALUES ('delete', old.rowid, old.text);
+    INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+"""
+
+# FTS4 keys external content by docid, and reads the old text to remove
+# from the content table, so rows leave the index before they change
+SQLITE_FTS4_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+    USING fts4(content='messages', text);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+BEGIN
+    INSERT INTO messages_fts (docid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete BEFORE DELETE ON messages
+BEGIN
+    DELETE FROM messages_fts WHERE docid = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_before_update BEFORE UPDATE
+    ON messages
+BEGIN
+    DELETE FROM messages_fts WHERE docid = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages
+BEGIN
+    INSERT INTO messages_fts (docid, text) VALUES (new.rowid, new.text);
+END;
+"""
+
+SQLITE_FTS_SCHEMAS = (
+    ('fts5', SQLITE_FTS5_SCHEMA),
+    ('fts4', SQLITE_FTS4_SCHEMA),
+)
+
+SQLITE_UPSERT = """
+INSERT INTO messages (channel, ts, ts_epoch, user, thread_ts, type, text,
+                      json)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (channel, ts) DO UPDATE SET
+    user = excluded.user, thread_ts = excluded.thread_ts,
+    type = excluded.type, text = excluded.text, json = excluded.json
+"""
+
+
+# the types json.loads gives nested values, written as JSON
+NESTED_TYPES = frozenset([dict, list])
+
+
+def cell(value):
+    # nested values are written as JSON rather than Python reprs
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def lookup_path(msg, path):
+    value = msg
+    for part in path:
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else None
+        else:
+            return None
+    return value
+
+
+def compile_columns(columns):
+    # Returns a function turning a message into a row for these columns.
+    # Columns may be dotted paths into nested fields, e.g. "reactions.0.name";
+    # plain keys are fetched in one pass with map() instead of a Python level
+    # loop, and only rows that hold a nested value go through cell().
+    paths = [tuple(column.split('.')) for column in columns]
+    if all(len(path) == 1 for path in paths):
+        keys = list(columns)
+        is_flat = NESTED_TYPES.isdisjoint
+
+        def project(msg):
+            row = list(map(msg.get, keys))
+            if is_flat(map(type, row)):
+                return row
+            return [cell(value) for value in row]
+    else:
+        def project(msg):
+            return [cell(lookup_path(msg, path)) for path in paths]
+    return project
+
+
+class CsvWriter(object):
+    # Writes messages as CSV rows. The columns are either given up front or
+    # taken from the keys of the first message written; a header passed in
+    # is one that is already in the file. Safe to share between export
+    # threads.
+
+    def __init__(self, csv_file, header=None):
+        self.csv_file = csv_file
+        self.csvwriter = csv.writer(csv_file)
+        self.header = []
+        self.project = None
+        self.count = 0
+        self.lock = threading.Lock()
+        if header:
+            self.set_header(header)
+
+    def set_header(self, header):
+        self.header = list(header)
+        self.project = compile_columns(self.header)
+
+    def write_header(self, header):
+        self.set_header(header)
+        self.csvwriter.writerow(self.header)
+
+    def write(self, msg):
+        with self.lock:
+            # Write the header if first row
+            if not self.header:
+                self.write_header(sorted(msg.keys()))
+
+            self.csvwriter.writerow(self.project(msg))
+            self.count += 1
+
+    def flush(self):
+        with self.lock:
+            self.csv_file.flush()
+
+    def close(self):
+        self.csv_file.close()
+
+
+class UnionCsvWriter(CsvWriter):
+    # Two pass writer whose header is the union of the keys of all messages.
+    # Messages are spilled to a temporary JSON Lines file as they arrive and
+    # only written out as CSV on close(), so memory use stays flat.
+
+    def __init__(self, csv_file, spool_dir=None):
+        CsvWriter.__init__(self, csv_file)
+        self.keys = set()
+        self.spool = tempfile.TemporaryFile(mode='w+', dir=spool_dir)
+
+    def write(self, msg):
+        with self.lock:
+            self.keys.update(msg)
+            self.spool.write(json.dumps(msg))
+            self.spool.write('\n')
+            self.count += 1
+
+    def close(self):
+        self.write_header(sorted(self.keys))
+        self.spool.seek(0)
+        for line in self.spool:
+            self.csvwriter.writerow(self.project(json.loads(line)))
+        self.spool.close()
+        CsvWriter.close(self)
+
+
+class JsonLinesWriter(object):
+    # Writes one JSON object per message and line, keeping nested fields
+    # as they are. With columns, only those (dotted) paths are kept.
+
+    def __init__(self, json_file, columns=None):
+        self.json_file = json_file
+        self.columns = columns
+        self.paths = None
+        if columns:
+            self.paths = [tuple(column.split('.')) for column in columns]
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def write(self, msg):
+        if self.paths is not None:
+            msg = dict((column, lookup_path(msg, path))
+                       for column, path in zip(self.columns, self.paths))
+        line = json.dumps(msg, sort_keys=True)
+        with self.lock:
+            self.json_file.write(line)
+            self.json_file.write('\n')
+            self.count += 1
+
+    def flush(self):
+        with self.lock:
+            self.json_file.flush()
+
+    def close(self):
+        self.json_file.close()
+
+
+class ParquetWriter(object):
+    # Buffers messages and writes them as Parquet row groups of
+    # row_group_size rows. The columns are the given ones or the keys of the
+    # first row group, keys only later messages have are not written (see
+    # UnionParquetWriter); every column is a string, with nested values
+    # stored as JSON. Needs pyarrow.
+
+    def __init__(self, filename, columns=None,
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE, compression=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow, install it "
+                              "with: pip install slack2csv[parquet]")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.filename = filename
+        self.header = list(columns) if columns else []
+        self.project = compile_columns(self.header) if columns else None
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.rows = []
+        self.writer = None
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def write(self, msg):
+        with self.lock:
+            self.rows.append(msg)
+            self.count += 1
+            if len(self.rows) >= self.row_group_size:
+                self.write_row_group()
+
+    def open(self):
+        if not self.header:
+            keys = set()
+            for msg in self.rows:
+                keys.update(msg)
+            self.header = sorted(keys)
+            self.project = compile_columns(self.header)
+        schema = self.pa.schema([(column, self.pa.string())
+                                 for column in self.header])
+        options = {}
+        if self.compression is not None:
+            options['compression'] = self.compression
+        self.writer = self.pq.ParquetWriter(self.filename, schema, **options)
+
+    def write_row_group(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            self.open()
+        rows = [self.project(msg) for msg in self.rows]
+        arrays = [self.pa.array([None if value is None else str(value)
+                                 for value in column],
+                                type=self.pa.string())
+                  for column in zip(*rows)]
+        self.writer.write_table(self.pa.Table.from_arrays(
+            arrays, names=self.header))
+        self.rows = []
+
+    def flush(self):
+        with self.lock:
+            self.write_row_group()
+
+    def close(self):
+        with self.lock:
+            self.write_row_group()
+            if self.writer is None:
+                self.open()
+            self.writer.close()
+
+
+class UnionParquetWriter(ParquetWriter):
+    # Parquet writer whose columns are the union of the keys of all
+    # messages, spooling them to a temporary JSON Lines file like
+    # UnionCsvWriter and writing the row groups on close().
+
+    def __init__(self, filename, row_group_size=DEFAULT_ROW_GROUP_SIZE,
+                 compression=None, spool_dir=None):
+        ParquetWriter.__init__(self, filename, None, row_group_size,
+                               compression)
+        self.keys = set()
+        self.spool = tempfile.TemporaryFile(mode='w+', dir=spool_dir)
+
+    def write(self, msg):
+        with self.lock:
+            self.keys.update(msg)
+            self.spool.write(json.dumps(msg))
+            self.spool.write('\n')
+            self.count += 1
+
+    def flush(self):
+        # nothing can be written before all the columns are known
+        pass
+
+    def close(self):
+        with self.lock:
+            self.header = sorted(self.keys)
+            self.project = compile_columns(self.header)
+            self.spool.seek(0)
+            for line in self.spool:
+                self.rows.append(json.loads(line))
+                if len(self.rows) >= self.row_group_size:
+                    self.write_row_group()
+            self.spool.close()
+        ParquetWriter.close(self)
+
+
+class SqliteWriter(object):
+    # Upserts messages into a SQLite database keyed by (channel, ts), with
+    # indexes on user, ts and thread_ts and a full text index on text, so
+    # exporting the same messages again updates them in place. Rows are
+    # written in transactions of batch_size rows and on every flush.
+
+    # export_conversation adds the channel to every message
+    needs_channel = True
+
+    def __init__(self, filename, batch_size=DEFAULT_SQLITE_BATCH_SIZE):
+        if sqlite3.sqlite_version_info < (3, 24, 0):
+            raise ValueError("SQLite output needs SQLite 3.24 or newer: ",
+                             sqlite3.sqlite_version)
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SQLITE_SCHEMA)
+        self.create_fts()
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def create_fts(self):
+        # the first full text module this SQLite has
+        for module, schema in SQLITE_FTS_SCHEMAS:
+            try:
+                self.db.executescript(schema)
+                return module
+            except sqlite3.OperationalError as e:
+                if 'no such module' not in str(e):
+                    raise
+        raise ValueError("SQLite output needs SQLite built with FTS5 or "
+                         "FTS4: ", sqlite3.sqlite_version)
+
+    def write(self, msg):
+        ts = msg.get('ts')
+        if not ts:
+            # nothing to key it by
+            return
+        row = (msg.get('channel'), ts, float(ts), msg.get('user'),
+               msg.get('thread_ts'), msg.get('type'), msg.get('text'),
+               json.dumps(msg, sort_keys=True))
+        with self.lock:
+            self.rows.append(row)
+            self.count += 1
+            if len(self.rows) >= self.batch_size:
+                self.commit()
+
+    def commit(self):
+        if not self.rows:
+            return
+        with self.db:
+            self.db.executemany(SQLITE_UPSERT, self.rows)
+        self.rows = []
+
+    def flush(self):
+        with self.lock:
+            self.commit()
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.db.close()
+
+
+class Partition(object):
+    # an open partition file and the number of threads writing to it
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.writers = 0
+
+
+class PartitionedWriter(object):
+    # Writes every message to the file for its day or month (in UTC), the
+    # filename with PERIOD_PLACEHOLDER replaced by e.g. "2026-10". Files are
+    # opened by open_writer(filename, append) as their first message comes
+    # in; past max_open, the least recently written idle one is closed and
+    # appended to if it is needed again. Every partition has its own
+    # writer, so export threads writing different periods do not wait for
+    # each other.
+
+    def __init__(self, filename, open_writer, partition='month', append=False,
+                 max_open=DEFAULT_OPEN_PARTITIONS):
+        self.filename = filename
+        self.open_writer = open_writer
+        self.period_format = PERIOD_FORMATS[partition]
+        self.append = append
+        self.max_open = max_open
+        self.partitions = OrderedDict()
+        # periods opened before, appended to when opened again
+        self.opened = set()
+        self.lock = threading.Lock()
+
+    def period(self, msg):
+        return time.strftime(self.period_format,
+                             time.gmtime(float(msg.get('ts') or 0)))
+
+    def acquire(self, period):
+        with self.lock:
+            partition = self.partitions.pop(period, None)
+            if partition is None:
+                filename = self.filename.replace(PERIOD_PLACEHOLDER, period)
+                directory = os.path.dirname(filename)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+                partition = Partition(self.open_writer(
+                    filename, self.append or period in self.opened))
+                self.opened.add(period)
+            self.partitions[period] = partition
+            partition.writers += 1
+            if (self.max_open is not None and
+                    len(self.partitions) > self.max_open):
+                idle = [p for p, open_partition in self.partitions.items()
+                        if open_partition.writers == 0]
+                for p in idle[:len(self.partitions) - self.max_open]:
+                    self.partitions.pop(p).writer.close()
+            return partition
+
+    def write(self, msg):
+        partition = self.acquire(self.period(msg))
+        try:
+            partition.writer.write(msg)
+        finally:
+            with self.lock:
+                partition.writers -= 1
+
+    def flush(self):
+        with self.lock:
+            for partition in self.partitions.values():
+                partition.writer.flush()
+
+    def close(self):
+        with self.lock:
+            while self.partitions:
+                self.partitions.popitem(last=False)[1].writer.close()
+
+
+def read_csv_header(filename, compress=None):
+    if not os.path.exists(filename):
+        return None
+    with open_input_file(filename, compress) as csv_file:
+        for row in csv.reader(csv_file):
+            return row
+    return None
+
+
+def open_csv_writer(filename, append=False, columns=None, schema='first',
+                    compress=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    # When appending to an existing CSV, keep writing rows in the order of
+    # its header instead of starting a new one.
+    header = None
+    if append:
+        header = read_csv_header(filename, compress)
+    mode = 'a' if header else 'w'
+    csv_file = open_output_file(filename, mode, compress, buffer_size)
+    if header:
+        return CsvWriter(csv_file, header)
+    if columns:
+        writer = CsvWriter(csv_file)
+        writer.write_header(columns)
+        return writer
+    if schema == 'union':
+        spool_dir = os.path.dirname(os.path.abspath(filename))
+        return UnionCsvWriter(csv_file, spool_dir)
+    return CsvWriter(csv_file)
+
+
+def open_jsonl_writer(filename, append=False, columns=None, schema='first',
+                      compress=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    return JsonLinesWriter(open_output_file(filename, 'a' if append else 'w',
+                                            compress, buffer_size), columns)
+
+
+def open_parquet_writer(filename, append=False, columns=None, schema='first',
+                        compress=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    # Parquet compresses each column chunk itself
+    if append and os.path.exists(filename):
+        raise ValueError("Can not append to an existing Parquet file: ",
+                         filename)
+    compression = None
+    if compress not in (None, 'auto'):
+        compression = compress
+    if schema == 'union' and not columns:
+        spool_dir = os.path.dirname(os.path.abspath(filename))
+        return UnionParquetWriter(filename, compression=compression,
+                                  spool_dir=spool_dir)
+    return ParquetWriter(filename, columns, compression=compression)
+
+
+def open_sqlite_writer(filename, append=False, columns=None, schema='first',
+                       compress=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    # always appends: messages already in the database are updated
+    if compress not in (None, 'auto', 'none'):
+        raise ValueError("SQLite output can not be compressed: ", compress)
+    return SqliteWriter(filename)
+
+
+WRITERS = {
+    'csv': open_csv_writer,
+    'jsonl': open_jsonl_writer,
+    'parquet': open_parquet_writer,
+    'sqlite': open_sqlite_writer,
+}
+
+
+def open_writer(filename, append=False, format='csv', columns=None,
+                schema='first', compress=None,
+                buffer_size=DEFAULT_BUFFER_SIZE):
+    return WRITERS[format](filename, append, columns, schema, compress,
+                           buffer_size)
+
+
+def open_partitioned_writer(filename, append=False, partition='month',
+                            open_writer=open_writer,
+                            max_open=DEFAULT_OPEN_PARTITIONS):
+    return PartitionedWriter(filename, open_writer, partition, append,
+                             max_open)